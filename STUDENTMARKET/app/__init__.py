@@ -5,6 +5,11 @@ from flask_principal import Principal, Permission, RoleNeed
 from flask_mail import Mail
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from app.admission import AdmissionControl
+from app.storage import Storage
+from app.view_counts import ViewCounter
+from app.live_feed import NewAdsFeed
+from app.profiling import RequestProfiler
 
 # Initialize extensions
 mongo = PyMongo()
@@ -16,6 +21,11 @@ limiter = Limiter(
     default_limits=["200 per day", "50 per hour"],
     storage_uri="memory://"
 )
+admission = AdmissionControl()
+db = Storage()
+view_counter = ViewCounter()
+new_ads_feed = NewAdsFeed()
+profiler = RequestProfiler()
 
 # Define permissions
 admin_permission = Permission(RoleNeed('admin'))
@@ -31,11 +41,17 @@ def create_app(config_name='default'):
     app.config.from_object(config[config_name])
     
     # Initialize extensions with app
-    mongo.init_app(app)
+    if app.config.get('STORAGE_BACKEND', 'mongo') == 'mongo':
+        mongo.init_app(app, event_listeners=[admission.latency])
+    db.init_app(app, mongo)
     login_manager.init_app(app)
     principals.init_app(app)
     mail.init_app(app)
     limiter.init_app(app)
+    admission.init_app(app)
+    view_counter.init_app(app)
+    new_ads_feed.init_app(app)
+    profiler.init_app(app)
     
     # Configure Flask-Login
     login_manager.login_view = 'auth.login'
@@ -46,10 +62,12 @@ def create_app(config_name='default'):
     from app.auth import auth_bp
     from app.main import main_bp
     from app.ads import ads_bp
+    from app.admin import admin_bp
     
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(main_bp)
     app.register_blueprint(ads_bp, url_prefix='/ads')
+    app.register_blueprint(admin_bp, url_prefix='/admin')
     
     # User loader for Flask-Login
     from app.models import User
@@ -59,9 +77,16 @@ def create_app(config_name='default'):
         return User.get_by_id(user_id)
     
     # Identity loader for Flask-Principal
-    from flask_principal import identity_loaded, UserNeed
+    from flask_principal import identity_loaded, Identity, UserNeed
     from flask_login import current_user
     
+    @principals.identity_loader
+    def load_identity():
+        # Login never sends identity_changed, so derive it from Flask-Login
+        if current_user.is_authenticated:
+            return Identity(current_user.id)
+        return None
+    
     @identity_loaded.connect_via(app)
     def on_identity_loaded(sender, identity):
         identity.user = current_user
@@ -73,6 +98,10 @@ def create_app(config_name='default'):
     # Register error handlers
     register_error_handlers(app)
     
+    # Register CLI commands
+    from app.commands import register_commands
+    register_commands(app)
+    
     # Security headers
     @app.after_request
     def set_security_headers(response):
@@ -87,16 +116,17 @@ def create_app(config_name='default'):
         from datetime import datetime
         return {'current_year': datetime.utcnow().year}
     
-    # Create admin user if configured
+    # Create admin user and indexes if configured
     with app.app_context():
         create_admin_user()
+        create_indexes()
     
     return app
 
 
 def register_error_handlers(app):
     """Register error handlers"""
-    from flask import render_template
+    from flask import render_template, make_response
     
     @app.errorhandler(403)
     def forbidden(e):
@@ -110,6 +140,14 @@ def register_error_handlers(app):
     def rate_limited(e):
         return render_template('errors/429.html'), 429
     
+    @app.errorhandler(503)
+    def service_unavailable(e):
+        response = make_response(render_template('errors/503.html'), 503)
+        retry_after = getattr(e, 'retry_after', None)
+        if retry_after:
+            response.headers['Retry-After'] = str(retry_after)
+        return response
+    
     @app.errorhandler(500)
     def internal_error(e):
         return render_template('errors/500.html'), 500
@@ -127,14 +165,14 @@ def create_admin_user():
     if not admin_email or not admin_password:
         return
     
-    # Check if mongo.db is available
+    # Check if the storage backend is available
     try:
-        from app import mongo
-        if getattr(mongo, 'db', None) is None:
-            print("Warning: MongoDB not initialized. Skipping admin creation.")
+        from app import db
+        if not db.is_available:
+            print("Warning: Storage backend not initialized. Skipping admin creation.")
             return
     except Exception as e:
-        print(f"Warning: Error checking MongoDB: {e}. Skipping admin creation.")
+        print(f"Warning: Error checking storage backend: {e}. Skipping admin creation.")
         return
     
     # Check if admin user already exists
@@ -145,3 +183,23 @@ def create_admin_user():
             print(f"Admin user '{admin_name}' created with email: {admin_email}")
     except Exception as e:
         print(f"Warning: Could not create admin user: {e}")
+
+
+def create_indexes():
+    """Create indexes used by models and batch jobs"""
+    from app import db, similar, archive, notifications, stats, view_counts, live_feed, geo, profiling
+    
+    if not db.is_available:
+        return
+    
+    try:
+        similar.ensure_indexes()
+        archive.ensure_indexes()
+        notifications.ensure_indexes()
+        stats.ensure_indexes()
+        view_counts.ensure_indexes()
+        live_feed.ensure_indexes()
+        geo.ensure_indexes()
+        profiling.ensure_indexes()
+    except Exception as e:
+        print(f"Warning: Could not create indexes: {e}")
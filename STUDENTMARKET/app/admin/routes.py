@@ -0,0 +1,81 @@
+from flask import render_template, request, redirect, url_for, flash, abort, Response
+from flask_login import login_required
+from app import admin_permission, stats, profiling
+from app.admin import admin_bp
+from app.models import Ad
+
+
+@admin_bp.route('/')
+@login_required
+@admin_permission.require(http_exception=403)
+def dashboard():
+    """Admin statistics dashboard rendered from pre-aggregated rollups"""
+    days = min(max(request.args.get('days', 30, type=int), 1), 365)
+    
+    daily = stats.get_daily(days=days)
+    totals = stats.get_totals()
+    
+    # Category totals over the shown window
+    category_totals = {}
+    for day in daily:
+        for category, count in day.get('categories', {}).items():
+            category_totals[category] = category_totals.get(category, 0) + count
+    
+    peak = max([day.get('ads_created', 0) for day in daily] + [1])
+    
+    return render_template(
+        'admin/dashboard.html',
+        daily=daily,
+        totals=totals,
+        category_totals=category_totals,
+        peak=peak,
+        days=days,
+        categories=Ad.CATEGORIES
+    )
+
+
+# Downloadable profile payloads: kind -> (field, file extension)
+PROFILE_DOWNLOADS = {
+    'collapsed': ('collapsed', 'folded'),
+    'allocations': ('allocations', 'txt'),
+}
+
+
+@admin_bp.route('/profiles')
+@login_required
+@admin_permission.require(http_exception=403)
+def profiles():
+    """List stored request profiles"""
+    return render_template(
+        'admin/profiles.html',
+        profiles=profiling.get_profiles(),
+        header=profiling.HEADER,
+        query_flag=profiling.QUERY_FLAG
+    )
+
+
+@admin_bp.route('/profiles/<profile_id>/<kind>')
+@login_required
+@admin_permission.require(http_exception=403)
+def download_profile(profile_id, kind):
+    """Download the collapsed stacks or allocation summary of a profile"""
+    if kind not in PROFILE_DOWNLOADS:
+        abort(404)
+    profile = profiling.get_profile(profile_id)
+    if not profile:
+        abort(404)
+    
+    field, extension = PROFILE_DOWNLOADS[kind]
+    response = Response(profile.get(field, ''), mimetype='text/plain')
+    response.headers['Content-Disposition'] = f'attachment; filename=profile-{profile_id}.{extension}'
+    return response
+
+
+@admin_bp.route('/profiles/<profile_id>/delete', methods=['POST'])
+@login_required
+@admin_permission.require(http_exception=403)
+def delete_profile(profile_id):
+    """Delete a stored profile"""
+    if profiling.delete_profile(profile_id):
+        flash('Profile deleted.', 'success')
+    return redirect(url_for('admin.profiles'))
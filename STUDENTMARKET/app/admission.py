@@ -0,0 +1,243 @@
+"""Admission control and load shedding.
+
+Requests are sorted into endpoint classes (search, login, browse, write).
+Each class has its own concurrency limit and a bounded wait queue with a
+deadline; a request that finds the queue full, or waits past its deadline,
+is shed with ``503 Service Unavailable`` and a ``Retry-After`` hint instead
+of piling up behind slow regex scans or password hashing. Endpoints outside
+these classes (about page, login form, static files) are never limited.
+
+Limits adapt to Mongo latency observed through a PyMongo command listener.
+Each command is charged to the class of the request that issued it (kept in
+a thread-local while the request holds its slot), so a slow regex search
+shrinks the search limit without starving browsing or writes. When a
+class's average command time rises above ``ADMISSION_TARGET_LATENCY_MS``
+its limit shrinks multiplicatively, and it grows back one slot at a time
+once that class is fast again. Login is not adapted: it is bound by
+password hashing, not by Mongo. ``getMore`` is left out of the averages: on
+change streams (the live feed) each idle ``getMore`` waits about a second
+on the server by design, which says nothing about how loaded Mongo is.
+
+Limits are per worker process, so they only matter with threaded workers
+(``gunicorn --threads N`` or ``--worker-class gthread``).
+"""
+import math
+import threading
+import time
+
+from flask import g, request
+from pymongo import monitoring
+from werkzeug.exceptions import ServiceUnavailable
+
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+LATENCY_IGNORED_COMMANDS = ('getMore',)  # awaitData cursors block on purpose
+ADAPTIVE_CLASSES = ('search', 'browse', 'write')  # login is CPU-bound (hashing)
+LOGIN_ENDPOINTS = ('auth.login', 'auth.register')
+SEARCH_ENDPOINTS = ('ads.list_ads', 'ads.my_ads')
+BROWSE_ENDPOINTS = (
+    'main.index', 'ads.list_ads', 'ads.view_ad', 'ads.my_ads',
+    'ads.my_ads_archive', 'ads.saved_searches'
+)
+
+# class name: (max concurrent, max waiting, max wait in seconds)
+DEFAULT_LIMITS = {
+    'search': (4, 8, 2.0),
+    'login': (2, 8, 3.0),
+    'browse': (8, 16, 2.0),
+    'write': (4, 8, 5.0),
+}
+
+
+def classify(req):
+    """Return the endpoint class of a request, or None if it is not limited"""
+    endpoint = req.endpoint
+    if endpoint is None or endpoint == 'static':
+        return None
+    if endpoint in LOGIN_ENDPOINTS:
+        return 'login' if req.method in WRITE_METHODS else None
+    if req.method in WRITE_METHODS:
+        return 'write'
+    if endpoint in SEARCH_ENDPOINTS and req.args.get('search'):
+        return 'search'
+    if endpoint in BROWSE_ENDPOINTS:
+        return 'browse'
+    return None
+
+
+class MongoLatency(monitoring.CommandListener):
+    """Exponentially weighted average of Mongo command durations"""
+
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+        self.average_ms = 0.0
+
+    def _observe(self, duration_micros):
+        ms = duration_micros / 1000.0
+        self.average_ms += self.alpha * (ms - self.average_ms)
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        if event.command_name not in LATENCY_IGNORED_COMMANDS:
+            self._observe(event.duration_micros)
+
+    def failed(self, event):
+        if event.command_name not in LATENCY_IGNORED_COMMANDS:
+            self._observe(event.duration_micros)
+
+
+class ClassLatency(monitoring.CommandListener):
+    """Routes command durations to a per-class MongoLatency via a thread-local"""
+
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+        self.classes = {}
+        self._current = threading.local()
+
+    def get(self, name):
+        """The latency tracker of a class, created on first use"""
+        latency = self.classes.get(name)
+        if latency is None:
+            latency = self.classes.setdefault(name, MongoLatency(self.alpha))
+        return latency
+
+    def enter(self, name):
+        """Charge commands on this thread to ``name`` until ``leave``"""
+        self._current.latency = self.get(name)
+
+    def leave(self):
+        self._current.latency = None
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        latency = getattr(self._current, 'latency', None)
+        if latency is not None:
+            latency.succeeded(event)
+
+    def failed(self, event):
+        latency = getattr(self._current, 'latency', None)
+        if latency is not None:
+            latency.failed(event)
+
+
+class ClassLimiter:
+    """Concurrency limit with a bounded, deadline-aware wait queue"""
+
+    def __init__(self, name, limit, max_waiting, timeout, min_limit=1):
+        self.name = name
+        self.max_limit = limit
+        self.min_limit = min(min_limit, limit)
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.service_ms = 100.0  # average request time, for Retry-After
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Take a slot; return False if the request must be shed"""
+        with self._cond:
+            if self.active < self.limit:
+                self.active += 1
+                return True
+            if self.waiting >= self.max_waiting:
+                return False
+
+            deadline = time.monotonic() + self.timeout
+            self.waiting += 1
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                self.active += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self, elapsed_ms):
+        """Free a slot and record how long the request took"""
+        with self._cond:
+            self.active -= 1
+            self.service_ms += 0.1 * (elapsed_ms - self.service_ms)
+            self._cond.notify()
+
+    def adapt(self, latency_ms, target_ms):
+        """AIMD: shrink on slow Mongo, grow back one slot when it recovers"""
+        with self._cond:
+            if latency_ms > target_ms:
+                self.limit = max(self.min_limit, int(self.limit * 0.75))
+            elif latency_ms < target_ms / 2 and self.limit < self.max_limit:
+                self.limit += 1
+                self._cond.notify()
+
+    def retry_after(self):
+        """Seconds until the backlog should have drained"""
+        backlog = self.active + self.waiting
+        return max(1, math.ceil(backlog * self.service_ms / 1000.0 / max(self.limit, 1)))
+
+
+class AdmissionControl:
+    """Flask extension enforcing per-endpoint-class concurrency limits"""
+
+    def __init__(self, app=None):
+        self.latency = ClassLatency()
+        self.limiters = {}
+        self.target_ms = 50.0
+        self.adjust_interval = 1.0
+        self._last_adjust = 0.0
+        self._adjust_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        limits = dict(DEFAULT_LIMITS)
+        limits.update(app.config.get('ADMISSION_LIMITS', {}))
+        self.limiters = {
+            name: ClassLimiter(name, limit, max_waiting, timeout)
+            for name, (limit, max_waiting, timeout) in limits.items()
+        }
+        self.target_ms = app.config.get('ADMISSION_TARGET_LATENCY_MS', 50.0)
+        self.adjust_interval = app.config.get('ADMISSION_ADJUST_INTERVAL', 1.0)
+
+        if app.config.get('ADMISSION_CONTROL_ENABLED', True):
+            app.before_request(self._before_request)
+            app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        limiter = self.limiters.get(classify(request))
+        if limiter is None:
+            return None
+
+        self._maybe_adapt()
+        if not limiter.acquire():
+            raise ServiceUnavailable(retry_after=limiter.retry_after())
+        g.admission = (limiter, time.monotonic())
+        self.latency.enter(limiter.name)
+        return None
+
+    def _teardown_request(self, exc):
+        admitted = g.pop('admission', None)
+        if admitted is not None:
+            self.latency.leave()
+            limiter, started = admitted
+            limiter.release((time.monotonic() - started) * 1000.0)
+
+    def _maybe_adapt(self):
+        now = time.monotonic()
+        if now - self._last_adjust < self.adjust_interval:
+            return
+        if not self._adjust_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_adjust = now
+            for name, limiter in self.limiters.items():
+                if name in ADAPTIVE_CLASSES:
+                    limiter.adapt(self.latency.get(name).average_ms, self.target_ms)
+        finally:
+            self._adjust_lock.release()
@@ -1,6 +1,7 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, TextAreaField, SelectField
-from wtforms.validators import DataRequired, Length
+from wtforms import StringField, TextAreaField, SelectField, FloatField
+from wtforms.validators import DataRequired, Length, Optional, NumberRange
+from app import geo
 from app.models import Ad
 
 
@@ -15,3 +16,34 @@ class AdForm(FlaskForm):
         Length(min=10, max=5000, message='Description must be between 10 and 5000 characters')
     ])
     category = SelectField('Category', validators=[DataRequired()], choices=Ad.CATEGORIES)
+    campus = SelectField('Campus', validators=[Optional()], choices=[])
+    location_name = StringField('Pickup point (optional)', validators=[
+        Optional(),
+        Length(max=100, message='Pickup point must be at most 100 characters')
+    ])
+    latitude = FloatField('Latitude', validators=[Optional(), NumberRange(min=-90, max=90)])
+    longitude = FloatField('Longitude', validators=[Optional(), NumberRange(min=-180, max=180)])
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.campus.choices = [('', 'No campus')] + [(c['id'], c['name']) for c in geo.campuses()]
+
+    def validate(self, extra_validators=None):
+        if not super().validate(extra_validators):
+            return False
+        if (self.latitude.data is None) != (self.longitude.data is None):
+            self.latitude.errors.append('Enter both latitude and longitude, or neither.')
+            return False
+        if self.location_name.data and not self.campus.data and self.latitude.data is None:
+            self.location_name.errors.append('Pick a campus or enter coordinates for the pickup point.')
+            return False
+        return True
+
+    def apply_location(self, ad):
+        """Copy the chosen campus or pickup coordinates onto an ad"""
+        ad.set_location(
+            lat=self.latitude.data,
+            lng=self.longitude.data,
+            name=self.location_name.data,
+            campus=self.campus.data or None
+        )
@@ -1,8 +1,11 @@
-from flask import render_template, redirect, url_for, flash, request, abort, current_app
+from flask import render_template, redirect, url_for, flash, request, abort, current_app, Response
 from flask_login import login_required, current_user
+from werkzeug.exceptions import ServiceUnavailable
+from app import geo, view_counter, new_ads_feed, limiter
+from app.live_feed import ads_since
 from app.ads import ads_bp
 from app.ads.forms import AdForm
-from app.models import Ad, User
+from app.models import Ad, User, SavedSearch
 
 
 @ads_bp.route('/')
@@ -11,13 +14,38 @@ def list_ads():
     page = request.args.get('page', 1, type=int)
     category = request.args.get('category', None)
     search = request.args.get('search', None)
+    sort = request.args.get('sort', 'newest')
+    if sort not in Ad.SORTS:
+        sort = 'newest'
     per_page = current_app.config.get('ITEMS_PER_PAGE', 12)
     
-    ads, total = Ad.get_all(category=category, search=search, page=page, per_page=per_page)
+    # Nearby filter: a configured campus or explicit coordinates
+    near = None
+    campus = geo.get_campus(request.args.get('campus') or '')
+    radius = request.args.get('radius', type=float)
+    if radius is None or not 0 < radius <= current_app.config.get('NEARBY_MAX_RADIUS_KM', 50):
+        radius = current_app.config.get('NEARBY_DEFAULT_RADIUS_KM', 5)
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    if campus:
+        near = (campus['lat'], campus['lng'])
+    elif lat is not None and lng is not None and -90 <= lat <= 90 and -180 <= lng <= 180:
+        near = (lat, lng)
+    
+    ads, total = Ad.get_all(category=category, search=search, page=page, per_page=per_page,
+                            sort=sort, near=near, radius_km=radius)
     
     # Calculate pagination
     total_pages = (total + per_page - 1) // per_page
     
+    # Query arguments carried over by pagination links
+    filters = {'search': search, 'category': category, 'sort': sort}
+    if near:
+        if campus:
+            filters.update(radius=radius, campus=campus['id'])
+        else:
+            filters.update(radius=radius, lat=lat, lng=lng)
+    
     return render_template(
         'ads/list.html',
         ads=ads,
@@ -26,10 +54,51 @@ def list_ads():
         total_pages=total_pages,
         category=category,
         search=search,
+        sort=sort,
+        near=near,
+        campus=campus['id'] if campus else None,
+        radius=radius,
+        filters=filters,
+        campuses=geo.campuses(),
+        radii=current_app.config.get('NEARBY_RADII_KM', [1, 2, 5, 10, 25]),
         categories=Ad.CATEGORIES
     )
 
 
+@ads_bp.route('/live')
+@limiter.exempt
+@login_required
+def live_feed():
+    """Stream newly created ads as Server-Sent Events"""
+    if not new_ads_feed.enabled:
+        abort(404)
+    
+    # A sync worker would be tied up by the stream until its timeout
+    if not request.environ.get('wsgi.multithread'):
+        raise ServiceUnavailable(retry_after=300)
+    
+    category = request.args.get('category') or None
+    if category == 'all':
+        category = None
+    if category and category not in dict(Ad.CATEGORIES):
+        abort(400)
+    
+    subscriber = new_ads_feed.subscribe(category)
+    if subscriber is None:
+        raise ServiceUnavailable(retry_after=30)
+    
+    # A reconnecting browser sends the last ad it saw; replay what it missed
+    replay = []
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    if last_event_id:
+        replay = ads_since(last_event_id, category, new_ads_feed.replay_limit)
+    
+    response = Response(new_ads_feed.stream(subscriber, replay), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @ads_bp.route('/<ad_id>')
 def view_ad(ad_id):
     """View single ad"""
@@ -37,8 +106,12 @@ def view_ad(ad_id):
     if not ad:
         abort(404)
     
+    view_counter.record(ad.id)
+    ad.views += view_counter.pending(ad.id)
+    
     creator = ad.get_creator()
-    return render_template('ads/view.html', ad=ad, creator=creator)
+    similar_ads = ad.get_similar()
+    return render_template('ads/view.html', ad=ad, creator=creator, similar_ads=similar_ads)
 
 
 @ads_bp.route('/create', methods=['GET', 'POST'])
@@ -54,6 +127,7 @@ def create_ad():
             category=form.category.data,
             created_by=current_user.id
         )
+        form.apply_location(ad)
         ad.save()
         
         flash('Ad created successfully!', 'success')
@@ -80,6 +154,7 @@ def edit_ad(ad_id):
         ad.title = form.title.data
         ad.description = form.description.data
         ad.category = form.category.data
+        form.apply_location(ad)
         ad.save()
         
         flash('Ad updated successfully!', 'success')
@@ -135,3 +210,114 @@ def my_ads():
         search=search,
         categories=Ad.CATEGORIES
     )
+
+
+@ads_bp.route('/my-ads/archive')
+@login_required
+def my_ads_archive():
+    """List current user's expired, archived ads"""
+    page = request.args.get('page', 1, type=int)
+    per_page = current_app.config.get('ITEMS_PER_PAGE', 12)
+    
+    ads, total = Ad.get_archived_by_user(current_user.id, page=page, per_page=per_page)
+    
+    # Calculate pagination
+    total_pages = (total + per_page - 1) // per_page
+    
+    return render_template(
+        'ads/my_ads_archive.html',
+        ads=ads,
+        total=total,
+        page=page,
+        total_pages=total_pages,
+        categories=Ad.CATEGORIES
+    )
+
+
+@ads_bp.route('/my-ads/archive/<ad_id>/relist', methods=['POST'])
+@login_required
+def relist_ad(ad_id):
+    """Move an archived ad back to the live listings"""
+    ad = Ad.get_archived_by_id(ad_id)
+    if not ad:
+        abort(404)
+    
+    if ad.created_by != current_user.id and not current_user.is_admin:
+        abort(403)
+    
+    ad.relist()
+    flash('Ad relisted successfully!', 'success')
+    return redirect(url_for('ads.view_ad', ad_id=ad.id))
+
+
+@ads_bp.route('/my-ads/archive/<ad_id>/delete', methods=['POST'])
+@login_required
+def delete_archived_ad(ad_id):
+    """Permanently delete an archived ad"""
+    ad = Ad.get_archived_by_id(ad_id)
+    if not ad:
+        abort(404)
+    
+    if ad.created_by != current_user.id and not current_user.is_admin:
+        abort(403)
+    
+    ad.delete()
+    flash('Archived ad deleted.', 'success')
+    return redirect(url_for('ads.my_ads_archive'))
+
+
+@ads_bp.route('/saved-searches')
+@login_required
+def saved_searches():
+    """List current user's saved searches"""
+    searches = SavedSearch.get_by_user(current_user.id)
+    return render_template(
+        'ads/saved_searches.html',
+        searches=searches,
+        categories=Ad.CATEGORIES
+    )
+
+
+@ads_bp.route('/saved-searches', methods=['POST'])
+@login_required
+def save_search():
+    """Save the current category/keyword search for digest emails"""
+    category = request.form.get('category') or None
+    search = (request.form.get('search') or '').strip() or None
+    back = url_for('ads.list_ads', category=category, search=search)
+    
+    if category and category not in dict(Ad.CATEGORIES):
+        abort(400)
+    
+    if not category and not search:
+        flash('Pick a category or enter search words to save a search.', 'warning')
+        return redirect(back)
+    
+    if SavedSearch.exists(current_user.id, category=category, search=search):
+        flash('You already saved this search.', 'info')
+        return redirect(back)
+    
+    limit = current_app.config.get('SAVED_SEARCH_LIMIT', 20)
+    if SavedSearch.count_by_user(current_user.id) >= limit:
+        flash(f'You can save up to {limit} searches. Delete one first.', 'warning')
+        return redirect(url_for('ads.saved_searches'))
+    
+    SavedSearch(user_id=current_user.id, category=category, search=search).save()
+    flash('Search saved! New matching ads will be emailed to you.', 'success')
+    return redirect(back)
+
+
+@ads_bp.route('/saved-searches/<search_id>/delete', methods=['POST'])
+@login_required
+def delete_saved_search(search_id):
+    """Delete a saved search"""
+    saved = SavedSearch.get_by_id(search_id)
+    if not saved:
+        abort(404)
+    
+    if saved.user_id != current_user.id:
+        abort(403)
+    
+    saved.delete()
+    flash('Saved search deleted.', 'success')
+    return redirect(url_for('ads.saved_searches'))
@@ -0,0 +1,70 @@
+"""Hot/cold archival of expired ads.
+
+Live ads stay in ``ads``; once an ad passes its ``expires_at`` the archiver
+moves it into ``ads_archive`` so scans, counts and sorts on the live
+collection only ever see current listings. Owners still reach archived ads
+through the archive view of "My Ads".
+"""
+from datetime import datetime, timedelta
+
+from app import db
+from app.storage import ReplaceOne
+
+
+def ensure_indexes():
+    """Create indexes used by expiry and the archive view"""
+    db.ads.create_index('expires_at')
+    db.ads_archive.create_index([('created_by', 1), ('archived_at', -1)])
+
+
+def expired_query(now, default_lifetime_days):
+    """Match live ads whose lifetime is over
+
+    Ads saved before expiry existed have no ``expires_at``; they expire on
+    the default lifetime counted from ``created_at``.
+    """
+    return {'$or': [
+        {'expires_at': {'$lte': now}},
+        {'expires_at': None,
+         'created_at': {'$lte': now - timedelta(days=default_lifetime_days)}}
+    ]}
+
+
+def archive_expired(batch_size=500, default_lifetime_days=120, max_batches=None, now=None):
+    """Move expired ads into ``ads_archive`` in batches
+
+    Each batch is copied with idempotent upserts before it is deleted from
+    the live collection, so a crash between the two steps is repaired by
+    the next run. Returns the number of ads archived.
+    """
+    from app import similar, stats
+
+    now = now or datetime.utcnow()
+    query = expired_query(now, default_lifetime_days)
+    archived = 0
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        docs = list(db.ads.find(query, sort=[('expires_at', 1)], limit=batch_size))
+        if not docs:
+            break
+
+        ops = []
+        for doc in docs:
+            doc['archived_at'] = now
+            ops.append(ReplaceOne({'_id': doc['_id']}, doc, upsert=True))
+        db.ads_archive.bulk_write(ops)
+
+        ids = [doc['_id'] for doc in docs]
+        db.ads.delete_many({'_id': {'$in': ids}})
+        try:
+            similar.remove_ads(ids)
+        except Exception as e:
+            # The batch is already archived; the nightly rebuild drops stale lists
+            print(f"Warning: Could not remove similar ads for archived batch: {e}")
+        stats.record_ads_archived(len(ids))
+
+        archived += len(docs)
+        batches += 1
+
+    return archived
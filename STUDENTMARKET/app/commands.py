@@ -0,0 +1,59 @@
+import click
+
+
+def register_commands(app):
+    """Register Flask CLI commands for batch jobs"""
+
+    @app.cli.command('rebuild-similar')
+    @click.option('--top-k', type=int, default=None, help='Neighbours stored per ad')
+    @click.option('--chunk-size', type=int, default=256, help='Rows scored per matrix chunk')
+    def rebuild_similar(top_k, chunk_size):
+        """Rebuild the precomputed similar-ads lists for all ads"""
+        from app import similar
+
+        top_k = top_k or app.config.get('SIMILAR_ADS_TOP_K', 6)
+        count = similar.rebuild_all(top_k=top_k, chunk_size=chunk_size)
+        click.echo(f'Rebuilt similar ads for {count} ads')
+
+    @app.cli.command('archive-ads')
+    @click.option('--batch-size', type=int, default=None, help='Ads moved per batch')
+    @click.option('--max-batches', type=int, default=None, help='Stop after this many batches')
+    def archive_ads(batch_size, max_batches):
+        """Move expired ads into the ads_archive collection"""
+        from app import archive
+
+        count = archive.archive_expired(
+            batch_size=batch_size or app.config.get('AD_ARCHIVE_BATCH_SIZE', 500),
+            default_lifetime_days=app.config.get('AD_LIFETIME_DAYS', 120),
+            max_batches=max_batches
+        )
+        click.echo(f'Archived {count} expired ads')
+
+    @app.cli.command('send-digests')
+    @click.option('--batch-size', type=int, default=None, help='Emails sent per SMTP session')
+    def send_digests(batch_size):
+        """Email queued saved-search matches as one digest per user"""
+        from app import notifications
+
+        count = notifications.send_digests(
+            batch_size=batch_size or app.config.get('DIGEST_BATCH_SIZE', 50),
+            max_ads=app.config.get('DIGEST_MAX_ADS', 20)
+        )
+        click.echo(f'Sent {count} digest emails')
+
+    @app.cli.command('backfill-search-words')
+    @click.option('--batch-size', type=int, default=1000, help='Ads updated per batch')
+    def backfill_search_words(batch_size):
+        """Store the searchable words of ads saved before search used them"""
+        from app import notifications
+
+        count = notifications.backfill_ad_words(batch_size=batch_size)
+        click.echo(f'Stored search words for {count} ads')
+
+    @app.cli.command('backfill-stats')
+    def backfill_stats():
+        """Rebuild the admin statistics rollups from existing users and ads"""
+        from app import stats
+
+        count = stats.backfill()
+        click.echo(f'Rebuilt statistics for {count} days')
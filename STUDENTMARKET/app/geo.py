@@ -0,0 +1,68 @@
+"""Ad locations and "nearby" queries.
+
+An ad can carry a pickup point, stored as a GeoJSON point in ``location``
+and covered by a ``2dsphere`` index together with ``category``. Nearby
+listings combine two queries on that index: ``$geoWithin``/``$centerSphere``
+for the total count (``$near`` cannot be counted) and ``$near`` with
+``$maxDistance`` for the page itself, which Mongo returns nearest first.
+Both stop at the radius, so skipping to a later page only walks ads inside
+it.
+
+Campuses offered in the ad form come from ``CAMPUS_LOCATIONS``.
+"""
+import math
+
+from flask import current_app
+
+EARTH_RADIUS_KM = 6378.1  # the radius Mongo uses for spherical geometry
+
+
+def ensure_indexes():
+    """Create the index used for nearby queries"""
+    from app import db
+    db.ads.create_index([('location', '2dsphere'), ('category', 1)])
+
+
+def point(lat, lng):
+    """GeoJSON point (GeoJSON puts longitude first)"""
+    return {'type': 'Point', 'coordinates': [float(lng), float(lat)]}
+
+
+def coordinates(location):
+    """(lat, lng) of a GeoJSON point, or None"""
+    if not isinstance(location, dict) or location.get('type') != 'Point':
+        return None
+    lng, lat = location['coordinates'][:2]
+    return lat, lng
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in kilometres (haversine)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def within(lat, lng, radius_km):
+    """Filter for points inside a radius (countable, unordered)"""
+    return {'$geoWithin': {'$centerSphere': [[float(lng), float(lat)], radius_km / EARTH_RADIUS_KM]}}
+
+
+def near(lat, lng, radius_km):
+    """Filter for points inside a radius, returned nearest first"""
+    return {'$near': {'$geometry': point(lat, lng), '$maxDistance': radius_km * 1000.0}}
+
+
+def campuses():
+    """Configured campuses: dicts with id, name, lat and lng"""
+    return current_app.config.get('CAMPUS_LOCATIONS', [])
+
+
+def get_campus(campus_id):
+    """Look up a configured campus by id"""
+    for campus in campuses():
+        if campus['id'] == campus_id:
+            return campus
+    return None
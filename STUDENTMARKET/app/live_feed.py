@@ -0,0 +1,258 @@
+"""Live feed of new ads over Server-Sent Events.
+
+Each worker process runs exactly one watcher thread, started with the first
+subscriber. It follows a Mongo change stream on ``ads`` (inserts only) and
+fans every new ad out to the connected clients whose category filter
+matches. Change streams need a replica set; on a standalone mongod, or
+with the embedded storage backends, the watcher polls ``created_at``
+instead every ``LIVE_FEED_POLL_INTERVAL`` seconds.
+
+Backpressure: every client gets a bounded queue of ``LIVE_FEED_QUEUE_SIZE``
+events. The watcher never blocks on a client; a client whose queue is full
+is cut off, and its browser reconnects with ``Last-Event-ID`` and catches
+up from the database (at most ``LIVE_FEED_REPLAY_LIMIT`` ads).
+
+Each open stream holds a worker thread. Streams may use ``WORKER_THREADS``
+minus ``LIVE_FEED_RESERVED_THREADS`` threads per worker (optionally capped
+lower by ``LIVE_FEED_MAX_CLIENTS``), so normal pages always keep threads
+to run on; beyond that, and on single-threaded (sync) workers, streams are
+refused with ``503``. Only logged-in users open the feed, and only while
+the page is visible.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+
+# Fields sent to clients
+EVENT_FIELDS = {'title': 1, 'category': 1, 'created_at': 1}
+
+# Inserts can commit slightly out of created_at order; polling looks back
+# this far and skips ads it has already published.
+POLL_LOOKBACK = timedelta(seconds=10)
+
+
+def ensure_indexes():
+    """Create the index used for polling and replaying new ads"""
+    from app import db
+    db.ads.create_index([('created_at', 1)])
+
+
+def to_event(doc):
+    """Turn an ad document into a feed event"""
+    return {
+        'id': str(doc['_id']),
+        'title': doc.get('title'),
+        'category': doc.get('category'),
+        'created_at': doc['created_at'].isoformat() + 'Z' if doc.get('created_at') else None,
+    }
+
+
+def ads_since(ad_id, category=None, limit=50):
+    """Events for ads created after a given ad, oldest first (for reconnects)"""
+    from app import db
+    try:
+        last = db.ads.find_one({'_id': ObjectId(ad_id)}, {'created_at': 1})
+    except Exception:
+        return []
+    if not last or not last.get('created_at'):
+        return []
+
+    query = {'created_at': {'$gt': last['created_at']}}
+    if category:
+        query['category'] = category
+    docs = db.ads.find(query, EVENT_FIELDS, sort=[('created_at', 1)], limit=limit)
+    return [to_event(doc) for doc in docs]
+
+
+class Subscriber:
+    """One connected client: a category filter and a bounded event queue"""
+
+    def __init__(self, category=None, maxsize=100):
+        self.category = category
+        self.events = queue.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def wants(self, event):
+        return self.category is None or self.category == event['category']
+
+    def offer(self, event):
+        """Queue an event without blocking; False if the client is too slow"""
+        if self.overflowed:
+            return False
+        try:
+            self.events.put_nowait(event)
+            return True
+        except queue.Full:
+            self.overflowed = True
+            return False
+
+
+class NewAdsFeed:
+    """Per-process fan-out of new ads to SSE subscribers"""
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.queue_size = 100
+        self.max_clients = 16
+        self.poll_interval = 2.0
+        self.heartbeat = 15.0
+        self.replay_limit = 50
+        self.mode = None  # 'change_stream' or 'polling' once started
+        self._subscribers = set()
+        self._listening_since = None  # when the first current subscriber arrived
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('LIVE_FEED_ENABLED', True)
+        self.queue_size = app.config.get('LIVE_FEED_QUEUE_SIZE', 100)
+        threads = app.config.get('WORKER_THREADS', 32)
+        self.max_clients = max(0, threads - app.config.get('LIVE_FEED_RESERVED_THREADS', 16))
+        if app.config.get('LIVE_FEED_MAX_CLIENTS') is not None:
+            self.max_clients = min(self.max_clients, app.config['LIVE_FEED_MAX_CLIENTS'])
+        self.poll_interval = app.config.get('LIVE_FEED_POLL_INTERVAL', 2.0)
+        self.heartbeat = app.config.get('LIVE_FEED_HEARTBEAT', 15.0)
+        self.replay_limit = app.config.get('LIVE_FEED_REPLAY_LIMIT', 50)
+
+    def subscribe(self, category=None):
+        """Register a client; None if this worker is at its client limit"""
+        if self.max_clients <= 0:
+            return None
+        self._ensure_watcher()
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                return None
+            subscriber = Subscriber(category, self.queue_size)
+            if not self._subscribers:
+                self._listening_since = datetime.utcnow()
+            self._subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, doc):
+        """Fan a new ad out to every matching subscriber"""
+        event = to_event(doc)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            if subscriber.wants(event):
+                subscriber.offer(event)
+
+    def _ensure_watcher(self):
+        # Threads do not survive fork, so start one per worker process
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._subscribers = set()
+            self._thread = threading.Thread(target=self._run, name='new-ads-feed', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        from app import db
+
+        while not db.is_available:
+            time.sleep(self.poll_interval)
+        try:
+            self._watch_change_stream(db)
+        except (NotImplementedError, OperationFailure) as e:
+            # Standalone mongod or embedded backend: no change streams
+            print(f"Warning: Change streams unavailable ({e}); polling for new ads.")
+        self._poll(db)
+
+    def _watch_change_stream(self, db):
+        pipeline = [{'$match': {'operationType': 'insert'}}]
+        resume_token = None
+        while True:
+            try:
+                with db.ads.watch(pipeline, resume_after=resume_token) as stream:
+                    self.mode = 'change_stream'
+                    for change in stream:
+                        resume_token = change['_id']
+                        self.publish(change['fullDocument'])
+            except OperationFailure as e:
+                if self.mode is None:
+                    raise
+                # The resume point may have rolled off the oplog; start fresh
+                print(f"Warning: Change stream failed: {e}")
+                resume_token = None
+                time.sleep(self.poll_interval)
+            except PyMongoError as e:
+                print(f"Warning: Change stream interrupted: {e}")
+                time.sleep(self.poll_interval)
+
+    def _poll(self, db):
+        self.mode = 'polling'
+        watermark = None  # newest created_at seen; None while nobody listens
+        published = {}  # ad id -> created_at, for ads inside the lookback window
+        while True:
+            time.sleep(self.poll_interval)
+            if not self._subscribers:
+                watermark = None
+                continue
+
+            # Ads already there when listening (re)started are not new
+            seeding = watermark is None
+            if seeding:
+                since = self._listening_since or datetime.utcnow()
+                watermark = since
+                published.clear()
+            try:
+                docs = db.ads.find(
+                    {'created_at': {'$gt': watermark - POLL_LOOKBACK}},
+                    EVENT_FIELDS,
+                    sort=[('created_at', 1)]
+                )
+                for doc in docs:
+                    if doc['_id'] in published:
+                        continue
+                    published[doc['_id']] = doc['created_at']
+                    watermark = max(watermark, doc['created_at'])
+                    if not seeding or doc['created_at'] > since:
+                        self.publish(doc)
+            except Exception as e:
+                print(f"Warning: Could not poll for new ads: {e}")
+                continue
+
+            cutoff = watermark - POLL_LOOKBACK
+            for ad_id in [i for i, created in published.items() if created <= cutoff]:
+                del published[ad_id]
+
+    def stream(self, subscriber, replay=()):
+        """Yield SSE frames for a subscriber until it disconnects or falls behind"""
+        try:
+            yield f'retry: {int(self.poll_interval * 1000)}\n\n'
+            for event in replay:
+                yield self._frame(event)
+            while True:
+                try:
+                    event = subscriber.events.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    if subscriber.overflowed:
+                        return
+                    yield ': keepalive\n\n'
+                    continue
+                yield self._frame(event)
+                if subscriber.overflowed and subscriber.events.empty():
+                    # Too slow: close so the browser reconnects and replays
+                    return
+        finally:
+            self.unsubscribe(subscriber)
+
+    @staticmethod
+    def _frame(event):
+        return f"id: {event['id']}\nevent: ad\ndata: {json.dumps(event)}\n\n"
@@ -1,17 +1,28 @@
-from app import mongo
+from app import db, geo, stats
+from flask import current_app
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from bson.objectid import ObjectId
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 import markdown
 import bleach
 
 
+def _record_stats(record, *args):
+    """Update the admin statistics rollups (best effort)"""
+    try:
+        record(*args)
+    except Exception as e:
+        # The primary write already happened. backfill-stats can rebuild the
+        # creation counts; a missed deletion, archival or relist stays uncounted.
+        print(f"Warning: Could not update statistics ({record.__name__}): {e}")
+
+
 class User(UserMixin):
     """User model with all required fields"""
     
     def __init__(self, name, email, password_hash, is_email_verified=False, 
-                 is_admin=False, dob=None, description='', _id=None):
+                 is_admin=False, dob=None, description='', _id=None, created_at=None):
         self.id = str(_id) if _id else None
         self.name = name
         self.email = email
@@ -20,7 +31,7 @@ class User(UserMixin):
         self.is_admin = is_admin
         self.dob = dob  # Date of birth
         self.description = description
-        self.created_at = datetime.utcnow()
+        self.created_at = created_at or datetime.utcnow()
         
     
     def set_password(self, password):
@@ -57,17 +68,17 @@ class User(UserMixin):
         """Save user to database"""
         data = self.to_dict()
         if self.id:
-            mongo.db.users.update_one({'_id': ObjectId(self.id)}, {'$set': data})
+            db.users.update_one({'_id': ObjectId(self.id)}, {'$set': data})
         else:
-            res = mongo.db.users.insert_one(data)
-            self.id = str(res.inserted_id)
+            self.id = str(db.users.insert_one(data))
+            _record_stats(stats.record_user_created, self)
         return self.id
     
     @staticmethod
     def get_by_id(user_id):
         """Get user by ID"""
         try:
-            data = mongo.db.users.find_one({'_id': ObjectId(user_id)})
+            data = db.users.find_one({'_id': ObjectId(user_id)})
             if data:
                 return User(
                     name=data['name'],
@@ -77,7 +88,8 @@ class User(UserMixin):
                     is_admin=data.get('is_admin', False),
                     dob=data.get('dob'),
                     description=data.get('description', ''),
-                    _id=data['_id']
+                    _id=data['_id'],
+                    created_at=data.get('created_at')
                 )
         except Exception:
             return None
@@ -86,7 +98,7 @@ class User(UserMixin):
     @staticmethod
     def get_by_email(email):
         """Get user by email"""
-        data = mongo.db.users.find_one({'email': email})
+        data = db.users.find_one({'email': email})
         if data:
             return User(
                 name=data['name'],
@@ -96,7 +108,8 @@ class User(UserMixin):
                 is_admin=data.get('is_admin', False),
                 dob=data.get('dob'),
                 description=data.get('description', ''),
-                _id=data['_id']
+                _id=data['_id'],
+                created_at=data.get('created_at')
             )
         return None
     
@@ -104,7 +117,7 @@ class User(UserMixin):
     def get_all():
         """Get all users"""
         users = []
-        for data in mongo.db.users.find():
+        for data in db.users.find():
             users.append(User(
                 name=data['name'],
                 email=data['email'],
@@ -113,7 +126,8 @@ class User(UserMixin):
                 is_admin=data.get('is_admin', False),
                 dob=data.get('dob'),
                 description=data.get('description', ''),
-                _id=data['_id']
+                _id=data['_id'],
+                created_at=data.get('created_at')
             ))
         return users
     
@@ -136,11 +150,17 @@ class User(UserMixin):
             return False
         
         # Delete all ads created by this user
-        for ad_data in mongo.db.ads.find({'created_by': self.id}):
+        for ad_data in db.ads.find({'created_by': self.id}):
             ad = Ad.from_dict(ad_data)
             ad.delete()
+        archived_deleted = db.ads_archive.delete_many({'created_by': self.id})
+        db.saved_searches.delete_many({'user_id': self.id})
+        db.search_matches.delete_many({'user_id': self.id})
         
-        mongo.db.users.delete_one({'_id': ObjectId(self.id)})
+        db.users.delete_one({'_id': ObjectId(self.id)})
+        
+        _record_stats(stats.record_archived_ads_deleted, archived_deleted)
+        _record_stats(stats.record_user_deleted, self)
         return True
 
 
@@ -158,8 +178,15 @@ class Ad:
         ('other', 'Other')
     ]
     
+    # Sort choices for ad listings
+    SORTS = {
+        'newest': [('created_at', -1)],
+        'views': [('views', -1), ('created_at', -1)]
+    }
+    
     def __init__(self, title, description, category, created_by,
-                 description_html='', _id=None, created_at=None):
+                 description_html='', _id=None, created_at=None, expires_at=None,
+                 archived_at=None, views=0, location=None, location_name=None, campus=None):
         self.id = str(_id) if _id else None
         self.title = title
         self.description = description
@@ -167,6 +194,20 @@ class Ad:
         self.category = category
         self.created_by = created_by  # User ID
         self.created_at = created_at or datetime.utcnow()
+        self.expires_at = expires_at
+        self.archived_at = archived_at  # Set only for ads read from the archive
+        self.views = views or 0  # Flushed in batches by app.view_counts
+        self.location = location  # GeoJSON point of the pickup spot, optional
+        self.location_name = location_name
+        self.campus = campus  # Id from CAMPUS_LOCATIONS, if picked from the list
+        self.distance_km = None  # Set by nearby queries
+    
+    @staticmethod
+    def lifetime_for(category):
+        """Get how long ads in a category stay live"""
+        lifetimes = current_app.config.get('AD_CATEGORY_LIFETIME_DAYS', {})
+        days = lifetimes.get(category, current_app.config.get('AD_LIFETIME_DAYS', 120))
+        return timedelta(days=days)
     
     @staticmethod
     def _markdown_to_html(markdown_text):
@@ -192,28 +233,101 @@ class Ad:
     
     def to_dict(self):
         """Convert ad to dictionary for MongoDB"""
+        from app import notifications
         return {
             'title': self.title,
             'description': self.description,
             'description_html': self.description_html,
+            'words': notifications.ad_words(self.title, self.description),
             'category': self.category,
             'created_by': self.created_by,
-            'created_at': self.created_at
+            'created_at': self.created_at,
+            'expires_at': self.expires_at,
+            'location': self.location,
+            'location_name': self.location_name,
+            'campus': self.campus
         }
     
+    @property
+    def latitude(self):
+        coords = geo.coordinates(self.location)
+        return coords[0] if coords else None
+    
+    @property
+    def longitude(self):
+        coords = geo.coordinates(self.location)
+        return coords[1] if coords else None
+    
+    def set_location(self, lat=None, lng=None, name=None, campus=None):
+        """Set the pickup point (a configured campus or coordinates), or clear it"""
+        if campus:
+            found = geo.get_campus(campus)
+            if found:
+                lat, lng, name = found['lat'], found['lng'], name or found['name']
+            else:
+                campus = None
+        
+        if lat is None or lng is None:
+            self.location = self.location_name = self.campus = None
+            return
+        
+        self.location = geo.point(lat, lng)
+        self.location_name = name or None
+        self.campus = campus
+    
     def save(self):
         """Save ad to database"""
         # Regenerate HTML from markdown
         self.description_html = self._markdown_to_html(self.description)
         
+        if not self.expires_at:
+            self.expires_at = self.created_at + self.lifetime_for(self.category)
+        
         data = self.to_dict()
+        is_new = not self.id
         if self.id:
-            mongo.db.ads.update_one({'_id': ObjectId(self.id)}, {'$set': data})
+            db.ads.update_one({'_id': ObjectId(self.id)}, {'$set': data})
         else:
-            res = mongo.db.ads.insert_one(data)
-            self.id = str(res.inserted_id)
+            # views is only ever $inc'ed by the view counter, never $set here
+            data['views'] = self.views
+            self.id = str(db.ads.insert_one(data))
+        
+        self._update_similar()
+        if is_new:
+            _record_stats(stats.record_ad_created, self)
+            self._match_saved_searches()
         return self.id
     
+    def _match_saved_searches(self):
+        """Queue this new ad for the digests of matching saved searches"""
+        from app import notifications
+        try:
+            notifications.match_new_ad(self)
+        except Exception as e:
+            print(f"Warning: Could not match saved searches for {self.id}: {e}")
+    
+    def _update_similar(self):
+        """Refresh precomputed similar ads for this ad"""
+        from app import similar
+        try:
+            similar.update_ad(
+                self,
+                top_k=current_app.config.get('SIMILAR_ADS_TOP_K', 6),
+                candidates=current_app.config.get('SIMILAR_ADS_CANDIDATES', 2000)
+            )
+        except Exception as e:
+            # Recommendations are best effort; the nightly rebuild catches up
+            print(f"Warning: Could not update similar ads for {self.id}: {e}")
+    
+    def _remove_similar(self):
+        """Drop this ad from the precomputed similar-ads lists"""
+        from app import similar
+        try:
+            similar.remove_ad(self.id)
+        except Exception as e:
+            # A stale neighbour id is skipped when read; the nightly rebuild drops it
+            print(f"Warning: Could not remove similar ads for {self.id}: {e}")
+    
     @staticmethod
     def from_dict(ad_data):
         """Create Ad instance from dictionary"""
@@ -224,14 +338,20 @@ class Ad:
             created_by=ad_data.get('created_by'),
             description_html=ad_data.get('description_html', ''),
             _id=ad_data.get('_id'),
-            created_at=ad_data.get('created_at')
+            created_at=ad_data.get('created_at'),
+            expires_at=ad_data.get('expires_at'),
+            archived_at=ad_data.get('archived_at'),
+            views=ad_data.get('views', 0),
+            location=ad_data.get('location'),
+            location_name=ad_data.get('location_name'),
+            campus=ad_data.get('campus')
         )
     
     @staticmethod
     def get_by_id(ad_id):
         """Get ad by ID"""
         try:
-            data = mongo.db.ads.find_one({'_id': ObjectId(ad_id)})
+            data = db.ads.find_one({'_id': ObjectId(ad_id)})
             if data:
                 return Ad.from_dict(data)
         except Exception:
@@ -239,21 +359,42 @@ class Ad:
         return None
     
     @staticmethod
-    def get_all(category=None, search=None, page=1, per_page=12):
-        """Get all ads with optional filtering and pagination"""
+    def get_all(category=None, search=None, page=1, per_page=12, sort='newest',
+                near=None, radius_km=None):
+        """Get all ads with optional filtering, sorting and pagination
+        
+        ``near`` is a ``(lat, lng)`` pair; with it only ads within
+        ``radius_km`` are returned, nearest first.
+        """
         query = {}
         
         if category and category != 'all':
             query['category'] = category
         
         if search:
-            query['$or'] = [
-                {'title': {'$regex': search, '$options': 'i'}},
-                {'description': {'$regex': search, '$options': 'i'}}
-            ]
+            from app import notifications
+            query.update(notifications.search_filter(search))
         
-        total = mongo.db.ads.count_documents(query)
-        cursor = mongo.db.ads.find(query).sort('created_at', -1).skip((page - 1) * per_page).limit(per_page)
+        if near:
+            lat, lng = near
+            total = db.ads.count_documents(dict(query, location=geo.within(lat, lng, radius_km)))
+            cursor = db.ads.find(
+                dict(query, location=geo.near(lat, lng, radius_km)),
+                skip=(page - 1) * per_page,
+                limit=per_page
+            )
+            ads = [Ad.from_dict(a) for a in cursor]
+            for ad in ads:
+                ad.distance_km = geo.distance_km(lat, lng, ad.latitude, ad.longitude)
+            return ads, total
+        
+        total = db.ads.count_documents(query)
+        cursor = db.ads.find(
+            query,
+            sort=Ad.SORTS.get(sort, Ad.SORTS['newest']),
+            skip=(page - 1) * per_page,
+            limit=per_page
+        )
         ads = [Ad.from_dict(a) for a in cursor]
         
         return ads, total
@@ -267,25 +408,184 @@ class Ad:
             query['category'] = category
         
         if search:
-            query['$or'] = [
-                {'title': {'$regex': search, '$options': 'i'}},
-                {'description': {'$regex': search, '$options': 'i'}}
-            ]
+            from app import notifications
+            query.update(notifications.search_filter(search))
+        
+        total = db.ads.count_documents(query)
+        cursor = db.ads.find(
+            query,
+            sort=[('created_at', -1)],
+            skip=(page - 1) * per_page,
+            limit=per_page
+        )
+        ads = [Ad.from_dict(a) for a in cursor]
         
-        total = mongo.db.ads.count_documents(query)
-        cursor = mongo.db.ads.find(query).sort('created_at', -1).skip((page - 1) * per_page).limit(per_page)
+        return ads, total
+    
+    @staticmethod
+    def get_archived_by_user(user_id, page=1, per_page=12):
+        """Get a user's archived (expired) ads"""
+        query = {'created_by': user_id}
+        
+        total = db.ads_archive.count_documents(query)
+        cursor = db.ads_archive.find(
+            query,
+            sort=[('archived_at', -1)],
+            skip=(page - 1) * per_page,
+            limit=per_page
+        )
         ads = [Ad.from_dict(a) for a in cursor]
         
         return ads, total
     
+    @staticmethod
+    def get_archived_by_id(ad_id):
+        """Get archived ad by ID"""
+        try:
+            data = db.ads_archive.find_one({'_id': ObjectId(ad_id)})
+            if data:
+                return Ad.from_dict(data)
+        except Exception:
+            return None
+        return None
+    
+    def relist(self):
+        """Move an archived ad back to the live collection with a fresh lifetime"""
+        if not self.id or not self.archived_at:
+            return False
+        
+        self.expires_at = datetime.utcnow() + self.lifetime_for(self.category)
+        self.archived_at = None
+        data = self.to_dict()
+        data['_id'] = ObjectId(self.id)
+        data['views'] = self.views
+        db.ads.replace_one({'_id': data['_id']}, data, upsert=True)
+        db.ads_archive.delete_one({'_id': data['_id']})
+        
+        _record_stats(stats.record_ad_relisted, self)
+        
+        self._update_similar()
+        return True
+    
     def delete(self):
         """Delete ad"""
         if not self.id:
             return False
         
-        mongo.db.ads.delete_one({'_id': ObjectId(self.id)})
+        if self.archived_at:
+            db.ads_archive.delete_one({'_id': ObjectId(self.id)})
+            _record_stats(stats.record_ad_deleted, self)
+            return True
+        
+        db.ads.delete_one({'_id': ObjectId(self.id)})
+        
+        self._remove_similar()
+        _record_stats(stats.record_ad_deleted, self)
         return True
     
+    def get_similar(self):
+        """Get precomputed similar ads, best match first"""
+        from app import similar
+        neighbour_ids = similar.get_neighbour_ids(self.id)
+        if not neighbour_ids:
+            return []
+        
+        object_ids = [ObjectId(ad_id) for ad_id in neighbour_ids]
+        found = {str(a['_id']): a for a in db.ads.find({'_id': {'$in': object_ids}})}
+        return [Ad.from_dict(found[ad_id]) for ad_id in neighbour_ids if ad_id in found]
+    
     def get_creator(self):
         """Get the user who created this ad"""
-        return User.get_by_id(self.created_by)
\ No newline at end of file
+        return User.get_by_id(self.created_by)
+
+
+class SavedSearch:
+    """A user's saved category/keyword search on the ads list"""
+    
+    def __init__(self, user_id, category=None, search=None, _id=None,
+                 created_at=None):
+        self.id = str(_id) if _id else None
+        self.user_id = user_id
+        self.category = category or None
+        self.search = (search or '').strip() or None
+        self.created_at = created_at or datetime.utcnow()
+    
+    @property
+    def terms(self):
+        """Search words that must all start a word of a matching ad"""
+        from app import notifications
+        return notifications.search_terms(self.search)
+    
+    def to_dict(self):
+        """Convert saved search to dictionary for MongoDB"""
+        from app import notifications
+        terms = self.terms
+        return {
+            'user_id': self.user_id,
+            'category': self.category,
+            'search': self.search,
+            'terms': terms,
+            'match_keys': terms or [notifications.ANY_TERM],
+            'created_at': self.created_at
+        }
+    
+    def save(self):
+        """Save saved search to database"""
+        data = self.to_dict()
+        if self.id:
+            db.saved_searches.update_one({'_id': ObjectId(self.id)}, {'$set': data})
+        else:
+            self.id = str(db.saved_searches.insert_one(data))
+        return self.id
+    
+    @staticmethod
+    def from_dict(data):
+        """Create SavedSearch instance from dictionary"""
+        return SavedSearch(
+            user_id=data.get('user_id'),
+            category=data.get('category'),
+            search=data.get('search'),
+            _id=data.get('_id'),
+            created_at=data.get('created_at')
+        )
+    
+    @staticmethod
+    def get_by_id(search_id):
+        """Get saved search by ID"""
+        try:
+            data = db.saved_searches.find_one({'_id': ObjectId(search_id)})
+            if data:
+                return SavedSearch.from_dict(data)
+        except Exception:
+            return None
+        return None
+    
+    @staticmethod
+    def get_by_user(user_id):
+        """Get all saved searches of a user, newest first"""
+        cursor = db.saved_searches.find({'user_id': user_id}, sort=[('created_at', -1)])
+        return [SavedSearch.from_dict(s) for s in cursor]
+    
+    @staticmethod
+    def count_by_user(user_id):
+        """Count a user's saved searches"""
+        return db.saved_searches.count_documents({'user_id': user_id})
+    
+    @staticmethod
+    def exists(user_id, category=None, search=None):
+        """Check whether the user already saved this exact search"""
+        query = {
+            'user_id': user_id,
+            'category': category or None,
+            'search': (search or '').strip() or None
+        }
+        return db.saved_searches.count_documents(query, limit=1) > 0
+    
+    def delete(self):
+        """Delete saved search and its pending matches"""
+        if not self.id:
+            return False
+        
+        db.saved_searches.delete_one({'_id': ObjectId(self.id)})
+        db.search_matches.delete_many({'saved_search_id': self.id})
+        return True
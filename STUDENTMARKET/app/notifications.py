@@ -0,0 +1,217 @@
+"""Saved-search matching and digest emails.
+
+Each saved search stores its search words in ``match_keys`` (or ``ANY_TERM``
+when it filters by category only). The multikey index on that field is an
+inverted index from words to subscriptions, so a new ad is matched with one
+indexed query on the prefixes of its words instead of re-running every
+saved search. A search matches an ad when every search word starts a word
+of the ad. The ads list applies the same rule (``search_filter``) to the
+``words`` array stored on every ad, so both sides share one tokenizer and
+list searches are prefix scans of the ``words`` index.
+Matches are queued in ``search_matches`` and mailed out periodically as one
+digest per user, many digests per SMTP session.
+"""
+import re
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from flask import current_app, url_for
+from flask_mail import Message
+
+from app import db, mail
+from app.storage import UpdateOne
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+ANY_TERM = '*'
+
+
+def search_terms(text):
+    """Distinct lowercase words of a search query or ad text"""
+    return sorted(set(WORD_RE.findall((text or '').lower())))
+
+
+def ad_words(title, description):
+    """Words of an ad, stored in its ``words`` array for searching"""
+    return search_terms(f'{title} {description}')
+
+
+def word_prefixes(words):
+    """Every prefix of every word ("calc" for "calculus")"""
+    prefixes = set()
+    for word in words:
+        prefixes.update(word[:end] for end in range(1, len(word) + 1))
+    return prefixes
+
+
+def search_filter(text):
+    """Query requiring every search word to start one of an ad's words"""
+    clauses = [{'words': {'$regex': '^' + re.escape(term)}} for term in search_terms(text)]
+    return {'$and': clauses} if clauses else {}
+
+
+def ensure_indexes():
+    """Create indexes used by saved searches and queued matches"""
+    db.saved_searches.create_index([('match_keys', 1), ('category', 1)])
+    db.saved_searches.create_index([('user_id', 1), ('created_at', -1)])
+    db.search_matches.create_index([('user_id', 1), ('created_at', 1)])
+    db.search_matches.create_index('saved_search_id')
+    db.ads.create_index('words')
+
+
+def backfill_ad_words(batch_size=1000):
+    """Store ``words`` on ads saved before it existed; return the count"""
+    updated = 0
+    for repository in (db.ads, db.ads_archive):
+        while True:
+            docs = list(repository.find({'words': {'$exists': False}},
+                                        {'title': 1, 'description': 1}, limit=batch_size))
+            if not docs:
+                break
+            repository.bulk_write([
+                UpdateOne({'_id': doc['_id']},
+                          {'$set': {'words': ad_words(doc.get('title'), doc.get('description'))}})
+                for doc in docs
+            ])
+            updated += len(docs)
+    return updated
+
+
+def match_new_ad(ad):
+    """Queue a newly created ad for every saved search it satisfies
+
+    Returns the number of matches queued.
+    """
+    ad_terms = word_prefixes(ad_words(ad.title, ad.description))
+    query = {
+        'match_keys': {'$in': list(ad_terms) + [ANY_TERM]},
+        'category': {'$in': [None, ad.category]},
+        'user_id': {'$ne': ad.created_by}
+    }
+    projection = {'user_id': 1, 'terms': 1}
+
+    now = datetime.utcnow()
+    matches = []
+    for saved in db.saved_searches.find(query, projection):
+        # The index finds searches sharing one word; all words must match
+        if not ad_terms.issuperset(saved.get('terms') or []):
+            continue
+        matches.append({
+            'user_id': saved['user_id'],
+            'saved_search_id': str(saved['_id']),
+            'ad_id': ad.id,
+            'created_at': now
+        })
+
+    if matches:
+        db.search_matches.insert_many(matches)
+    return len(matches)
+
+
+def _describe(saved):
+    if not saved:
+        return 'a saved search'
+    parts = []
+    if saved.get('search'):
+        parts.append(f'"{saved["search"]}"')
+    if saved.get('category'):
+        from app.models import Ad
+        parts.append(dict(Ad.CATEGORIES).get(saved['category'], saved['category']))
+    return ' in '.join(parts)
+
+
+def build_digest(user, matches, max_ads=20):
+    """Build one digest email for a user's queued matches"""
+    search_ids = {m['saved_search_id'] for m in matches}
+    ad_ids = {m['ad_id'] for m in matches}
+    searches = {str(s['_id']): s for s in db.saved_searches.find(
+        {'_id': {'$in': [ObjectId(i) for i in search_ids]}}
+    )}
+    ads = {str(a['_id']): a for a in db.ads.find(
+        {'_id': {'$in': [ObjectId(i) for i in ad_ids]}},
+        {'title': 1}
+    )}
+
+    lines = [f"Hi {user['name']},", '', 'New ads match your saved searches:', '']
+    shown = 0
+    by_search = {}
+    for m in matches:
+        if m['ad_id'] in ads:  # skip ads deleted or archived since
+            by_search.setdefault(m['saved_search_id'], []).append(m['ad_id'])
+
+    for search_id, search_ad_ids in by_search.items():
+        if shown >= max_ads:
+            break
+        lines.append(f'{_describe(searches.get(search_id))}:')
+        for ad_id in dict.fromkeys(search_ad_ids):
+            if shown >= max_ads:
+                break
+            lines.append(f"  - {ads[ad_id]['title']}")
+            lines.append(f"    {url_for('ads.view_ad', ad_id=ad_id, _external=True)}")
+            shown += 1
+        lines.append('')
+
+    if not shown:
+        return None
+
+    remaining = len({a for ids in by_search.values() for a in ids}) - shown
+    if remaining > 0:
+        lines.append(f'...and {remaining} more on {url_for("ads.list_ads", _external=True)}')
+        lines.append('')
+    lines.append(f'Manage your saved searches: {url_for("ads.saved_searches", _external=True)}')
+
+    return Message(
+        subject=f'{shown} new ad{"s" if shown != 1 else ""} for your saved searches - StudentMarket',
+        recipients=[user['email']],
+        body='\n'.join(lines)
+    )
+
+
+def _iter_user_matches():
+    """Yield (user_id, matches) in user order without loading the whole queue"""
+    current_user_id = None
+    current = []
+    cursor = db.search_matches.find(sort=[('user_id', 1), ('created_at', 1)])
+    for match in cursor:
+        if match['user_id'] != current_user_id and current:
+            yield current_user_id, current
+            current = []
+        current_user_id = match['user_id']
+        current.append(match)
+    if current:
+        yield current_user_id, current
+
+
+def _send_batch(batch):
+    """Send a batch of (message, match_ids) over one SMTP session"""
+    messages = [message for message, _ in batch if message is not None]
+    if messages:
+        with mail.connect() as conn:
+            for message in messages:
+                conn.send(message)
+    sent_ids = [match_id for _, match_ids in batch for match_id in match_ids]
+    db.search_matches.delete_many({'_id': {'$in': sent_ids}})
+
+
+def send_digests(batch_size=50, max_ads=20):
+    """Send one digest per user with queued matches
+
+    Digests go out ``batch_size`` at a time over a single SMTP connection.
+    Matches are removed only after their batch was sent, so a failure
+    leaves the rest queued for the next run. Returns the number of emails.
+    """
+    base_url = current_app.config.get('SITE_URL', 'http://localhost:5000')
+    sent = 0
+    with current_app.test_request_context(base_url=base_url):
+        batch = []
+        for user_id, matches in _iter_user_matches():
+            user = db.users.find_one({'_id': ObjectId(user_id)}, {'name': 1, 'email': 1})
+            message = build_digest(user, matches, max_ads) if user else None
+            batch.append((message, [m['_id'] for m in matches]))
+            if message is not None:
+                sent += 1
+            if len(batch) >= batch_size:
+                _send_batch(batch)
+                batch = []
+        if batch:
+            _send_batch(batch)
+    return sent
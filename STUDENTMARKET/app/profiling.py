@@ -0,0 +1,246 @@
+"""On-demand profiling of single requests for admins.
+
+An admin adds ``X-Profile: 1`` (or ``?_profile=1``) to a request. For that
+one request a sampling thread records the handling thread's Python stack
+every ``PROFILER_INTERVAL_MS``, and ``tracemalloc`` traces allocations.
+The result is stored in the ``profiles`` collection:
+
+- ``collapsed``: one ``frame;frame;frame count`` line per distinct stack,
+  the input format of flamegraph.pl, speedscope and inferno
+- ``allocations``: top allocation sites still alive at the end of the
+  request, plus the traced peak
+
+Profiles are listed and downloaded under ``/admin/profiles`` and expire
+after ``PROFILE_RETENTION_DAYS``. The response carries ``X-Profile-Id``.
+
+Overhead: with ``PROFILER_ENABLED`` off no hooks are installed at all. When
+it is on, an unprofiled request costs one header and one query argument
+lookup; the admin check and everything else only run for flagged requests.
+One request per worker is profiled at a time because tracemalloc is
+process-wide; a second flagged request runs unprofiled.
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from flask import g, request
+
+HEADER = 'X-Profile'
+QUERY_FLAG = '_profile'
+
+# Fields shown in the profile list (payloads are only loaded for download)
+SUMMARY_FIELDS = {
+    'created_at': 1, 'user_id': 1, 'method': 1, 'path': 1, 'endpoint': 1,
+    'status': 1, 'duration_ms': 1, 'samples': 1, 'interval_ms': 1, 'peak_bytes': 1,
+}
+
+_short_paths = {}
+
+
+def ensure_indexes():
+    """Create indexes for stored profiles (expiring after the retention)"""
+    from flask import current_app
+    from app import db
+    days = current_app.config.get('PROFILE_RETENTION_DAYS', 7)
+    db.profiles.create_index('created_at', expireAfterSeconds=days * 86400)
+
+
+def _short_path(filename):
+    """File path relative to the project or site-packages, for frame names"""
+    short = _short_paths.get(filename)
+    if short is None:
+        short = filename
+        roots = sorted({os.path.abspath(p) for p in sys.path if p}, key=len, reverse=True)
+        for root in roots:
+            if filename.startswith(root + os.sep):
+                short = filename[len(root) + 1:]
+                break
+        _short_paths[filename] = short
+    return short
+
+
+def frame_name(code):
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f'{name} ({_short_path(code.co_filename)}:{code.co_firstlineno})'.replace(';', ':')
+
+
+class StackSampler:
+    """Samples one thread's stack at a fixed interval into collapsed stacks"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_name(frame.f_code))
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+    def collapsed(self):
+        """Collapsed-stack text, heaviest stacks first"""
+        lines = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        return '\n'.join(f'{stack} {count}' for stack, count in lines) + '\n'
+
+
+def allocation_summary(snapshot, peak, limit=30):
+    """Text report of the biggest allocation sites in a snapshot"""
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+    stats = snapshot.statistics('traceback')
+    total = sum(stat.size for stat in stats)
+    lines = [
+        f'Traced peak: {peak / 1024:.1f} KiB',
+        f'Still allocated at end of request: {total / 1024:.1f} KiB in {sum(s.count for s in stats)} blocks',
+        '',
+    ]
+    for index, stat in enumerate(stats[:limit], 1):
+        lines.append(f'#{index}: {stat.size / 1024:.1f} KiB in {stat.count} blocks')
+        for line in stat.traceback.format(most_recent_first=True):
+            lines.append(f'    {line}')
+    return '\n'.join(lines) + '\n'
+
+
+class RequestProfiler:
+    """Flask extension profiling single, admin-flagged requests"""
+
+    def __init__(self, app=None):
+        self.interval = 0.005
+        self.tracemalloc_frames = 10
+        self.top_allocations = 30
+        self._busy = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.interval = app.config.get('PROFILER_INTERVAL_MS', 5) / 1000.0
+        self.tracemalloc_frames = app.config.get('PROFILER_TRACEMALLOC_FRAMES', 10)
+        self.top_allocations = app.config.get('PROFILER_TOP_ALLOCATIONS', 30)
+
+        if app.config.get('PROFILER_ENABLED', True):
+            app.before_request(self._before_request)
+            app.after_request(self._after_request)
+            app.teardown_request(self._teardown_request)
+
+    def _requested(self):
+        return HEADER in request.headers or QUERY_FLAG in request.args
+
+    def _before_request(self):
+        if not self._requested():
+            return None
+
+        from app import admin_permission
+        if not admin_permission.can():
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(self.tracemalloc_frames)
+        tracemalloc.reset_peak()
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        g.profile = {
+            'id': ObjectId(),
+            'sampler': sampler,
+            'started_tracing': started_tracing,
+            'started': time.perf_counter(),
+            'status': None,
+        }
+        sampler.start()
+        return None
+
+    def _after_request(self, response):
+        profile = g.get('profile')
+        if profile is not None:
+            profile['status'] = response.status_code
+            response.headers['X-Profile-Id'] = str(profile['id'])
+        return response
+
+    def _teardown_request(self, exc):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+        try:
+            duration_ms = (time.perf_counter() - profile['started']) * 1000.0
+            sampler = profile['sampler']
+            sampler.stop()
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if profile['started_tracing']:
+                tracemalloc.stop()
+
+            from flask_login import current_user
+            from app import db
+            db.profiles.insert_one({
+                '_id': profile['id'],
+                'created_at': datetime.utcnow(),
+                'user_id': current_user.get_id(),
+                'method': request.method,
+                'path': request.full_path.rstrip('?'),
+                'endpoint': request.endpoint,
+                'status': profile['status'] or 500,
+                'duration_ms': round(duration_ms, 1),
+                'samples': sampler.samples,
+                'interval_ms': self.interval * 1000.0,
+                'peak_bytes': peak,
+                'collapsed': sampler.collapsed(),
+                'allocations': allocation_summary(snapshot, peak, self.top_allocations),
+            })
+        except Exception as e:
+            print(f"Warning: Could not store request profile: {e}")
+        finally:
+            self._busy.release()
+
+
+def get_profiles(limit=100):
+    """Recent profiles without their payloads, newest first"""
+    from app import db
+    return list(db.profiles.find(
+        {},
+        SUMMARY_FIELDS,
+        sort=[('created_at', -1)],
+        limit=limit
+    ))
+
+
+def get_profile(profile_id):
+    """Get a stored profile with its payloads"""
+    from app import db
+    try:
+        return db.profiles.find_one({'_id': ObjectId(profile_id)})
+    except Exception:
+        return None
+
+
+def delete_profile(profile_id):
+    """Delete a stored profile; return the deleted count"""
+    from app import db
+    try:
+        return db.profiles.delete_one({'_id': ObjectId(profile_id)})
+    except Exception:
+        return 0
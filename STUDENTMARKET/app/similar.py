@@ -0,0 +1,322 @@
+"""Precomputed "similar ads" recommendations.
+
+Ads are turned into TF-IDF vectors over title and description. The full
+rebuild computes the top-k neighbours of every ad in one batch, and
+``update_ad`` keeps the stored lists fresh when a single ad is created or
+edited. ``view_ad`` only reads the stored neighbour ids.
+
+The rebuild's IDF weights are stored one document per term in
+``similar_idf`` (``_id`` is the term), so ``update_ad`` fetches only the
+terms of the ads it scores instead of the whole vocabulary.
+"""
+import math
+import re
+from datetime import datetime
+
+import numpy as np
+from scipy import sparse
+from bson.objectid import ObjectId
+
+from app import db
+from app.storage import ReplaceOne, UpdateOne
+
+TOKEN_RE = re.compile(r'[^\W\d_]{2,}', re.UNICODE)
+MODEL_ID = 'tfidf'
+MAX_DF = 0.05
+MIN_DOCS_FOR_MAX_DF = 200
+MAX_LIST_UPDATES = 100
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens"""
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def ad_text(ad_data):
+    """Text used to vectorize an ad (title counts twice)"""
+    title = ad_data.get('title') or ''
+    return f"{title} {title} {ad_data.get('description') or ''}"
+
+
+def fit_idf(token_lists, max_df=MAX_DF):
+    """Build vocabulary and smoothed IDF weights from tokenized documents
+
+    Terms found in more than ``max_df`` of the documents are dropped: they
+    barely separate ads, yet dominate the cost of the similarity product.
+    Returns ``(vocabulary, idf, common_terms)``, the last being the dropped
+    terms.
+    """
+    counts = {}
+    for tokens in token_lists:
+        for term in set(tokens):
+            counts[term] = counts.get(term, 0) + 1
+
+    n_docs = len(token_lists)
+    limit = max(1, int(max_df * n_docs)) if n_docs >= MIN_DOCS_FOR_MAX_DF else n_docs
+    vocabulary = {}
+    df = []
+    common_terms = []
+    for term, count in counts.items():
+        if count <= limit:
+            vocabulary[term] = len(df)
+            df.append(count)
+        else:
+            common_terms.append(term)
+    idf = np.log((1 + n_docs) / (1 + np.asarray(df, dtype=np.float64))) + 1.0
+    return vocabulary, idf.astype(np.float32), sorted(common_terms)
+
+
+def vectorize(token_lists, vocabulary, idf):
+    """Build an L2-normalized sublinear TF-IDF matrix (CSR, one row per doc)"""
+    indptr = [0]
+    indices = []
+    data = []
+    for tokens in token_lists:
+        counts = {}
+        for term in tokens:
+            idx = vocabulary.get(term)
+            if idx is not None:
+                counts[idx] = counts.get(idx, 0) + 1
+        indices.extend(counts.keys())
+        data.extend(counts.values())
+        indptr.append(len(indices))
+
+    matrix = sparse.csr_matrix(
+        (np.asarray(data, dtype=np.float32),
+         np.asarray(indices, dtype=np.int32),
+         np.asarray(indptr, dtype=np.int64)),
+        shape=(len(token_lists), len(idf))
+    )
+    matrix.data = (1.0 + np.log(matrix.data)) * idf[matrix.indices]
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms).dot(matrix).tocsr().astype(np.float32)
+
+
+def top_k_neighbours(matrix, top_k, chunk_size=256):
+    """Yield (row, neighbour_rows, scores) for every row of the matrix
+
+    Cosine similarities are computed one chunk of rows at a time against the
+    whole matrix and kept sparse, so only ads sharing at least one term are
+    ever ranked and peak memory stays proportional to the chunk.
+    """
+    n_rows = matrix.shape[0]
+    if n_rows < 2 or top_k <= 0:
+        return
+    transposed = matrix.T.tocsc()
+
+    for start in range(0, n_rows, chunk_size):
+        stop = min(start + chunk_size, n_rows)
+        scores = (matrix[start:stop] @ transposed).tocsr()
+
+        for offset in range(stop - start):
+            lo, hi = scores.indptr[offset], scores.indptr[offset + 1]
+            cols = scores.indices[lo:hi]
+            values = scores.data[lo:hi]
+
+            keep = (cols != start + offset) & (values > 0)  # never the ad itself
+            cols, values = cols[keep], values[keep]
+            if len(values) > top_k:
+                best = np.argpartition(-values, top_k - 1)[:top_k]
+                cols, values = cols[best], values[best]
+            order = np.argsort(-values, kind='stable')
+            yield start + offset, cols[order], values[order]
+
+
+def compute_neighbours(docs, top_k, chunk_size=256):
+    """Compute top-k similar ads for a list of ad dicts
+
+    Returns ``(vocabulary, idf, common_terms,
+    {ad_id: [(neighbour_id, score), ...]})``.
+    """
+    token_lists = [tokenize(ad_text(d)) for d in docs]
+    vocabulary, idf, common_terms = fit_idf(token_lists)
+    matrix = vectorize(token_lists, vocabulary, idf)
+
+    ids = [str(d['_id']) for d in docs]
+    neighbours = {ad_id: [] for ad_id in ids}
+    for row, cols, scores in top_k_neighbours(matrix, top_k, chunk_size):
+        neighbours[ids[row]] = [(ids[c], float(s)) for c, s in zip(cols, scores)]
+    return vocabulary, idf, common_terms, neighbours
+
+
+def _neighbour_docs(pairs):
+    return [{'ad_id': ad_id, 'score': round(score, 5)} for ad_id, score in pairs]
+
+
+def _save_model(vocabulary, idf, common_terms, n_docs, batch_size=1000):
+    """Persist the IDF weights so single-ad updates use the same scale
+
+    The terms the rebuild dropped as too common are kept too, so that
+    ``update_ad`` ignores them instead of treating them as unseen (and
+    giving them the highest weight there is).
+    """
+    now = datetime.utcnow()
+    terms = [{'_id': term, 'idf': float(idf[idx]), 'updated_at': now}
+             for term, idx in vocabulary.items()]
+    terms.extend({'_id': term, 'common': True, 'updated_at': now} for term in common_terms)
+    for start in range(0, len(terms), batch_size):
+        db.similar_idf.bulk_write([ReplaceOne({'_id': doc['_id']}, doc, upsert=True)
+                                   for doc in terms[start:start + batch_size]])
+    db.similar_idf.delete_many({'updated_at': {'$lt': now}})
+
+    db.similar_model.replace_one(
+        {'_id': MODEL_ID},
+        {'_id': MODEL_ID, 'n_docs': n_docs, 'updated_at': now},
+        upsert=True
+    )
+
+
+def _load_model(terms):
+    """IDF weights and common terms of the last rebuild, for the given terms"""
+    doc = db.similar_model.find_one({'_id': MODEL_ID}, {'n_docs': 1})
+    if not doc:
+        return None
+    idf_map = {}
+    common_terms = set()
+    for row in db.similar_idf.find({'_id': {'$in': list(terms)}}, {'idf': 1, 'common': 1}):
+        if row.get('common'):
+            common_terms.add(row['_id'])
+        else:
+            idf_map[row['_id']] = row['idf']
+    return idf_map, common_terms, doc.get('n_docs', 0)
+
+
+def ensure_indexes():
+    """Create indexes used by the similar-ads collections"""
+    db.ad_similar.create_index('neighbours.ad_id')
+
+
+def rebuild_all(top_k=6, chunk_size=256, batch_size=1000):
+    """Recompute neighbours for every ad and replace the stored lists"""
+    projection = {'title': 1, 'description': 1}
+    docs = list(db.ads.find({}, projection))
+    vocabulary, idf, common_terms, neighbours = compute_neighbours(docs, top_k, chunk_size)
+
+    now = datetime.utcnow()
+    ops = []
+    for ad_id, pairs in neighbours.items():
+        ops.append(ReplaceOne(
+            {'_id': ad_id},
+            {'_id': ad_id, 'neighbours': _neighbour_docs(pairs), 'updated_at': now},
+            upsert=True
+        ))
+        if len(ops) >= batch_size:
+            db.ad_similar.bulk_write(ops)
+            ops = []
+    if ops:
+        db.ad_similar.bulk_write(ops)
+
+    # Drop lists of ads that no longer exist
+    db.ad_similar.delete_many({'updated_at': {'$lt': now}})
+    _save_model(vocabulary, idf, common_terms, len(docs), batch_size)
+    ensure_indexes()
+    return len(docs)
+
+
+def update_ad(ad, top_k=6, candidates=2000, max_list_updates=MAX_LIST_UPDATES):
+    """Incrementally refresh neighbours after a single ad is saved
+
+    The ad is scored against the most recent ``candidates`` ads of the same
+    category using the IDF weights of the last full rebuild. Its own list is
+    replaced, and it is pushed into the lists of its ``max_list_updates``
+    best-scoring candidates where it now beats a stored neighbour.
+    """
+    ad_id = str(ad.id)
+    cursor = db.ads.find(
+        {'category': ad.category, '_id': {'$ne': ObjectId(ad_id)}},
+        {'title': 1, 'description': 1},
+        sort=[('created_at', -1)],
+        limit=candidates
+    )
+    docs = list(cursor)
+
+    new_tokens = tokenize(ad_text({'title': ad.title, 'description': ad.description}))
+    token_lists = [new_tokens] + [tokenize(ad_text(d)) for d in docs]
+
+    model = _load_model({term for tokens in token_lists for term in tokens})
+    if model:
+        idf_map, common_terms, n_docs = model
+        vocabulary = {}
+        weights = []
+        default_idf = math.log(1 + n_docs) + 1.0  # unseen term, df = 0
+        for tokens in token_lists:
+            for term in tokens:
+                if term not in vocabulary and term not in common_terms:
+                    vocabulary[term] = len(weights)
+                    weights.append(idf_map.get(term, default_idf))
+        idf = np.asarray(weights, dtype=np.float32)
+    else:
+        vocabulary, idf, _ = fit_idf(token_lists)
+
+    db.ad_similar.update_many(
+        {'neighbours.ad_id': ad_id},
+        {'$pull': {'neighbours': {'ad_id': ad_id}}}
+    )
+
+    if not docs:
+        db.ad_similar.replace_one(
+            {'_id': ad_id},
+            {'_id': ad_id, 'neighbours': [], 'updated_at': datetime.utcnow()},
+            upsert=True
+        )
+        return
+
+    matrix = vectorize(token_lists, vocabulary, idf)
+    scores = (matrix[1:] @ matrix[0].T).toarray().ravel()
+
+    k = min(top_k, len(docs))
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best])]
+    pairs = [(str(docs[i]['_id']), float(scores[i])) for i in best if scores[i] > 0]
+
+    now = datetime.utcnow()
+    ops = [ReplaceOne(
+        {'_id': ad_id},
+        {'_id': ad_id, 'neighbours': _neighbour_docs(pairs), 'updated_at': now},
+        upsert=True
+    )]
+    matches = np.nonzero(scores > 0)[0]
+    if len(matches) > max_list_updates:
+        matches = matches[np.argpartition(-scores[matches], max_list_updates - 1)[:max_list_updates]]
+    for i in matches:
+        score = round(float(scores[i]), 5)
+        # Only touch lists that are not full or hold a weaker neighbour
+        ops.append(UpdateOne(
+            {'_id': str(docs[i]['_id']), '$or': [
+                {f'neighbours.{top_k - 1}': {'$exists': False}},
+                {'neighbours': {'$elemMatch': {'score': {'$lt': score}}}}
+            ]},
+            {'$push': {'neighbours': {
+                '$each': [{'ad_id': ad_id, 'score': score}],
+                '$sort': {'score': -1},
+                '$slice': top_k
+            }}}
+        ))
+    db.ad_similar.bulk_write(ops)
+
+
+def remove_ad(ad_id):
+    """Forget a deleted ad's list and remove it from other ads' lists"""
+    remove_ads([ad_id])
+
+
+def remove_ads(ad_ids):
+    """Forget several ads at once (used by deletes and the archiver)"""
+    ad_ids = [str(ad_id) for ad_id in ad_ids]
+    if not ad_ids:
+        return
+    db.ad_similar.delete_many({'_id': {'$in': ad_ids}})
+    db.ad_similar.update_many(
+        {'neighbours.ad_id': {'$in': ad_ids}},
+        {'$pull': {'neighbours': {'ad_id': {'$in': ad_ids}}}}
+    )
+
+
+def get_neighbour_ids(ad_id):
+    """Return precomputed neighbour ids for an ad, best first"""
+    doc = db.ad_similar.find_one({'_id': str(ad_id)}, {'neighbours.ad_id': 1})
+    if not doc:
+        return []
+    return [n['ad_id'] for n in doc.get('neighbours', [])]
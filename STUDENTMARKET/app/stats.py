@@ -0,0 +1,218 @@
+"""Pre-aggregated statistics for the admin dashboard.
+
+Model writes bump counters with ``$inc`` upserts, so the dashboard reads a
+fixed number of small documents instead of scanning ``users`` and ``ads``:
+
+- ``stats_daily``: one document per UTC day (``_id`` is ``YYYY-MM-DD``)
+  with ads/users created and deleted, ads per category and active posters
+- ``stats_totals``: a single ``totals`` document with running totals
+- ``stats_posters``: one short-lived marker per (day, user) used to count
+  each poster once per day
+"""
+from datetime import datetime, timedelta
+
+from app import db
+from app.storage import UpdateOne
+
+TOTALS_ID = 'totals'
+POSTER_MARKER_TTL = 3 * 24 * 3600  # markers are only needed for the current day
+
+
+def day_key(moment):
+    """UTC day bucket for a datetime"""
+    return (moment or datetime.utcnow()).strftime('%Y-%m-%d')
+
+
+def _bump(day, counters, totals=None):
+    db.stats_daily.update_one({'_id': day}, {'$inc': counters}, upsert=True)
+    if totals:
+        db.stats_totals.update_one({'_id': TOTALS_ID}, {'$inc': totals}, upsert=True)
+
+
+def record_ad_created(ad):
+    """Count a new ad and, once per day, its poster"""
+    day = day_key(ad.created_at)
+    counters = {'ads_created': 1, f'categories.{ad.category}': 1}
+
+    marker = db.stats_posters.update_one(
+        {'_id': f'{day}:{ad.created_by}'},
+        {'$setOnInsert': {'user_id': ad.created_by, 'created_at': datetime.utcnow()}},
+        upsert=True
+    )
+    if marker.upserted_id is not None:
+        counters['active_posters'] = 1
+
+    _bump(day, counters, {'ads_created': 1, 'ads_live': 1})
+
+
+def record_ad_deleted(ad):
+    """Count a deleted live or archived ad"""
+    bucket = 'ads_archived' if ad.archived_at else 'ads_live'
+    _bump(day_key(None), {'ads_deleted': 1}, {'ads_deleted': 1, bucket: -1})
+
+
+def record_ads_archived(count):
+    """Count ads moved to the archive by the archiver"""
+    if count:
+        _bump(day_key(None), {'ads_archived': count}, {'ads_archived': count, 'ads_live': -count})
+
+
+def record_archived_ads_deleted(count):
+    """Count archived ads removed together with their owner"""
+    if count:
+        _bump(day_key(None), {'ads_deleted': count}, {'ads_deleted': count, 'ads_archived': -count})
+
+
+def record_ad_relisted(ad):
+    """Count an archived ad returning to the live collection"""
+    _bump(day_key(None), {'ads_relisted': 1}, {'ads_archived': -1, 'ads_live': 1})
+
+
+def record_user_created(user):
+    """Count a new user"""
+    _bump(day_key(user.created_at), {'users_created': 1}, {'users': 1})
+
+
+def record_user_deleted(user):
+    """Count a deleted user"""
+    _bump(day_key(None), {'users_deleted': 1}, {'users': -1})
+
+
+def ensure_indexes():
+    """Create indexes used by the rollups"""
+    db.stats_posters.create_index('created_at', expireAfterSeconds=POSTER_MARKER_TTL)
+
+
+def get_totals():
+    """Running totals (users, ads created, live and archived ads)"""
+    return db.stats_totals.find_one({'_id': TOTALS_ID}) or {}
+
+
+def get_daily(days=30, today=None):
+    """Daily rollups for the last ``days`` days, oldest first, gaps filled"""
+    today = today or datetime.utcnow()
+    keys = [day_key(today - timedelta(days=offset)) for offset in range(days - 1, -1, -1)]
+    found = {d['_id']: d for d in db.stats_daily.find(
+        {'_id': {'$gte': keys[0], '$lte': keys[-1]}}
+    )}
+    return [found.get(key, {'_id': key}) for key in keys]
+
+
+def _ad_groups(repository):
+    """Yield ``(day, category, user_id, count)`` for the ads of a collection
+
+    MongoDB groups server-side, so only one row per group leaves the
+    primary; the embedded engine streams projected documents instead.
+    """
+    pipeline = [
+        {'$match': {'created_at': {'$type': 'date'}}},
+        {'$group': {
+            '_id': {
+                'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$created_at'}},
+                'category': '$category',
+                'user_id': '$created_by'
+            },
+            'count': {'$sum': 1}
+        }}
+    ]
+    try:
+        rows = repository.aggregate(pipeline, allowDiskUse=True)
+    except NotImplementedError:
+        rows = None
+    if rows is not None:
+        for row in rows:
+            yield row['_id']['day'], row['_id'].get('category'), row['_id'].get('user_id'), row['count']
+        return
+
+    groups = {}
+    ad_fields = {'created_at': 1, 'category': 1, 'created_by': 1}
+    for ad in repository.find({'created_at': {'$type': 'date'}}, ad_fields):
+        key = (day_key(ad['created_at']), ad.get('category'), ad.get('created_by'))
+        groups[key] = groups.get(key, 0) + 1
+    for (day, category, user_id), count in groups.items():
+        yield day, category, user_id, count
+
+
+def _user_days(repository):
+    """Yield ``(day, count)`` of users created per UTC day"""
+    pipeline = [
+        {'$match': {'created_at': {'$type': 'date'}}},
+        {'$group': {
+            '_id': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$created_at'}},
+            'count': {'$sum': 1}
+        }}
+    ]
+    try:
+        rows = repository.aggregate(pipeline, allowDiskUse=True)
+    except NotImplementedError:
+        rows = None
+    if rows is not None:
+        for row in rows:
+            yield row['_id'], row['count']
+        return
+
+    days = {}
+    for user in repository.find({'created_at': {'$type': 'date'}}, {'created_at': 1}):
+        day = day_key(user['created_at'])
+        days[day] = days.get(day, 0) + 1
+    yield from days.items()
+
+
+def backfill(batch_size=1000):
+    """Rebuild the creation rollups from the users, ads and ads_archive collections
+
+    Only what can be derived from existing documents is rewritten: the daily
+    ``ads_created``, ``categories``, ``active_posters`` and ``users_created``
+    and the live/archived/user totals. Deletions, archivals and relists
+    leave no trace in the collections, so their counters (daily and the
+    ``ads_deleted`` total) are kept as recorded.
+    Returns the number of daily documents written.
+    """
+    daily = {}
+
+    def add(day, field, value):
+        doc = daily.setdefault(day, {})
+        doc[field] = doc.get(field, 0) + value
+
+    posters = set()
+    for repository in (db.ads, db.ads_archive):
+        for day, category, user_id, count in _ad_groups(repository):
+            add(day, 'ads_created', count)
+            categories = daily[day].setdefault('categories', {})
+            categories[category] = categories.get(category, 0) + count
+            posters.add((day, user_id))
+
+    for day, _ in posters:
+        add(day, 'active_posters', 1)
+
+    for day, count in _user_days(db.users):
+        add(day, 'users_created', count)
+
+    db.stats_posters.delete_many({})
+
+    ops = [UpdateOne({'_id': day}, {'$set': counters}, upsert=True)
+           for day, counters in daily.items()]
+    for start in range(0, len(ops), batch_size):
+        db.stats_daily.bulk_write(ops[start:start + batch_size])
+
+    # Only today's markers matter for incremental updates
+    now = datetime.utcnow()
+    marker_ops = [UpdateOne({'_id': f'{day}:{user_id}'},
+                            {'$set': {'user_id': user_id, 'created_at': now}}, upsert=True)
+                  for day, user_id in posters if day == day_key(now)]
+    for start in range(0, len(marker_ops), batch_size):
+        db.stats_posters.bulk_write(marker_ops[start:start + batch_size])
+
+    live = db.ads.count_documents({})
+    archived = db.ads_archive.count_documents({})
+    deleted = get_totals().get('ads_deleted', 0)
+    db.stats_totals.replace_one({'_id': TOTALS_ID}, {
+        '_id': TOTALS_ID,
+        'users': db.users.count_documents({}),
+        'ads_created': live + archived + deleted,
+        'ads_live': live,
+        'ads_archived': archived,
+        'ads_deleted': deleted
+    }, upsert=True)
+
+    return len(daily)
@@ -0,0 +1,135 @@
+"""Storage layer under the models.
+
+Models and batch jobs talk to collections through repositories instead of
+``mongo.db`` directly. Every repository offers the same small, Mongo-style
+API (filters, update operators, sort and pagination), so the backend can
+be chosen with ``STORAGE_BACKEND``:
+
+- ``mongo``: a MongoDB database through Flask-PyMongo (default)
+- ``memory``: an embedded in-process engine with secondary indexes
+- ``sqlite``: the embedded engine, persisted to ``SQLITE_PATH``
+
+Repository API (see ``Repository``): ``insert_one``, ``insert_many``,
+``find_one``, ``find``, ``count_documents``, ``update_one``,
+``update_many``, ``replace_one``, ``delete_one``, ``delete_many``,
+``bulk_write``, ``create_index``, and ``aggregate`` and ``watch`` (Mongo
+only; callers fall back when they raise ``NotImplementedError``).
+"""
+from collections import namedtuple
+
+BACKENDS = ('mongo', 'memory', 'sqlite')
+
+# Write operations accepted by Repository.bulk_write
+ReplaceOne = namedtuple('ReplaceOne', ['filter', 'replacement', 'upsert'])
+ReplaceOne.__new__.__defaults__ = (False,)
+UpdateOne = namedtuple('UpdateOne', ['filter', 'update', 'upsert'])
+UpdateOne.__new__.__defaults__ = (False,)
+
+# Result of update_one / update_many / replace_one
+UpdateResult = namedtuple('UpdateResult', ['matched_count', 'modified_count', 'upserted_id'])
+
+
+class Repository:
+    """Interface shared by all storage backends
+
+    ``filter`` arguments are Mongo query documents, ``update`` arguments
+    use ``$set``, ``$inc``, ``$setOnInsert``, ``$push`` and ``$pull``, and
+    ``sort`` is a list of ``(field, 1 | -1)`` pairs.
+    """
+
+    def insert_one(self, doc):
+        """Insert a document and return its ``_id``"""
+        raise NotImplementedError
+
+    def insert_many(self, docs):
+        """Insert several documents and return their ids"""
+        raise NotImplementedError
+
+    def find_one(self, filter=None, projection=None):
+        """Return the first matching document or None"""
+        raise NotImplementedError
+
+    def find(self, filter=None, projection=None, sort=None, skip=0, limit=0):
+        """Return an iterable of matching documents"""
+        raise NotImplementedError
+
+    def count_documents(self, filter=None, limit=0):
+        """Count matching documents (stop at ``limit`` when given)"""
+        raise NotImplementedError
+
+    def update_one(self, filter, update, upsert=False):
+        """Update the first matching document; return an UpdateResult"""
+        raise NotImplementedError
+
+    def update_many(self, filter, update):
+        """Update all matching documents; return an UpdateResult"""
+        raise NotImplementedError
+
+    def replace_one(self, filter, replacement, upsert=False):
+        """Replace the first matching document; return an UpdateResult"""
+        raise NotImplementedError
+
+    def delete_one(self, filter):
+        """Delete the first matching document; return the deleted count"""
+        raise NotImplementedError
+
+    def delete_many(self, filter):
+        """Delete all matching documents; return the deleted count"""
+        raise NotImplementedError
+
+    def bulk_write(self, operations):
+        """Apply ReplaceOne / UpdateOne operations in one round trip"""
+        raise NotImplementedError
+
+    def create_index(self, keys, **options):
+        """Create a secondary index (``keys`` is a field or list of pairs)"""
+        raise NotImplementedError
+
+    def aggregate(self, pipeline, **options):
+        """Run an aggregation pipeline; backends without one raise NotImplementedError"""
+        raise NotImplementedError(f'{type(self).__name__} has no aggregation pipeline')
+
+    def watch(self, pipeline=None, **options):
+        """Open a change stream; backends without one raise NotImplementedError"""
+        raise NotImplementedError(f'{type(self).__name__} has no change streams')
+
+
+class Storage:
+    """Registry of repositories for the configured backend
+
+    Repositories are reached as attributes, e.g. ``storage.ads``.
+    """
+
+    def __init__(self):
+        self.backend = None
+        self.backend_name = None
+
+    def init_app(self, app, mongo=None):
+        name = app.config.get('STORAGE_BACKEND', 'mongo')
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown STORAGE_BACKEND '{name}', expected one of {BACKENDS}")
+
+        if name == 'mongo':
+            from app.storage.mongo import MongoBackend
+            self.backend = MongoBackend(mongo)
+        elif name == 'memory':
+            from app.storage.memory import MemoryBackend
+            self.backend = MemoryBackend()
+        else:
+            from app.storage.memory import MemoryBackend
+            from app.storage.sqlite import SQLitePersistence
+            self.backend = MemoryBackend(SQLitePersistence(app.config['SQLITE_PATH']))
+        self.backend_name = name
+
+    @property
+    def is_available(self):
+        """Whether a backend is configured and connected"""
+        return self.backend is not None and self.backend.is_available
+
+    def __getattr__(self, name):
+        if name.startswith('_') or self.__dict__.get('backend') is None:
+            raise AttributeError(name)
+        return self.backend.repository(name)
+
+    def __getitem__(self, name):
+        return self.backend.repository(name)
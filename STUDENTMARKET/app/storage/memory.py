@@ -0,0 +1,754 @@
+"""Embedded in-memory backend.
+
+Documents live in per-collection dicts keyed by ``_id``. The engine
+understands the subset of Mongo query and update syntax the app uses:
+
+- filters: equality (including array membership and ``None`` for missing
+  fields), ``$in``, ``$nin``, ``$ne``, ``$lt``, ``$lte``, ``$gt``, ``$gte``,
+  ``$exists``, ``$regex``/``$options``, ``$elemMatch``, ``$type: 'date'``,
+  ``$or``, ``$and`` and dotted paths into subdocuments and arrays
+- geo filters on GeoJSON points: ``$geoWithin`` with ``$centerSphere`` and
+  ``$near`` with ``$geometry``/``$maxDistance``/``$minDistance`` (results
+  come back nearest first, as in Mongo)
+- updates: ``$set``, ``$unset``, ``$inc``, ``$setOnInsert``, ``$push``
+  (with ``$each``/``$sort``/``$slice``) and ``$pull``
+- projections: inclusion of top-level fields
+
+``create_index`` builds a hash index on the first indexed field; equality
+and ``$in`` filters on that field only look at matching buckets. A
+``2dsphere`` index becomes a grid of lat/lng cells, so geo filters only
+look at cells overlapping the query circle. Indexes
+are multikey (array elements are indexed individually), ``unique`` is
+enforced and ``expireAfterSeconds`` purges expired documents on writes.
+
+Returned documents are copies, so callers can modify them freely.
+"""
+import copy
+import math
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from app.geo import EARTH_RADIUS_KM, coordinates, distance_km
+from app.storage import Repository, ReplaceOne, UpdateOne, UpdateResult
+
+MISSING = object()
+TTL_CHECK_INTERVAL = 60.0
+
+
+# Paths and values --------------------------------------------------------
+
+def _values_at(value, parts):
+    """All values reachable at a dotted path, MISSING where absent
+
+    Arrays are traversed like Mongo does: a numeric part indexes into the
+    array, any other part is looked up in every subdocument element.
+    """
+    if not parts:
+        return [value]
+    part, rest = parts[0], parts[1:]
+    if isinstance(value, dict):
+        if part in value:
+            return _values_at(value[part], rest)
+        return [MISSING]
+    if isinstance(value, list):
+        if part.isdigit():
+            index = int(part)
+            return _values_at(value[index], rest) if index < len(value) else [MISSING]
+        found = []
+        for element in value:
+            if isinstance(element, dict):
+                found.extend(v for v in _values_at(element, parts) if v is not MISSING)
+        return found or [MISSING]
+    return [MISSING]
+
+
+def get_values(doc, path):
+    return _values_at(doc, path.split('.'))
+
+
+def _expand(values):
+    """Candidate values for comparison: arrays count as their elements too"""
+    expanded = []
+    for value in values:
+        if isinstance(value, list):
+            expanded.extend(value)
+        expanded.append(value)
+    return expanded
+
+
+def _type_rank(value):
+    if value is None or value is MISSING:
+        return 0
+    if isinstance(value, bool):
+        return 6
+    if isinstance(value, (int, float)):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, dict):
+        return 3
+    if isinstance(value, list):
+        return 4
+    if isinstance(value, ObjectId):
+        return 5
+    if isinstance(value, datetime):
+        return 7
+    return 8
+
+
+def _comparable(a, b):
+    return a is not MISSING and b is not None and _type_rank(a) == _type_rank(b)
+
+
+def _equals(value, target):
+    if target is None:
+        return value is None or value is MISSING
+    return value is not MISSING and value == target
+
+
+# Geo ---------------------------------------------------------------------
+
+def _distances_km(values, lng, lat):
+    """Distances from (lng, lat) to every GeoJSON point among the values"""
+    found = []
+    for value in values:
+        coords = coordinates(value)
+        if coords is not None:
+            found.append(distance_km(coords[0], coords[1], lat, lng))
+    return found
+
+
+def _geo_circle(cond):
+    """(lng, lat, radius_km) of a $near / $geoWithin condition, or None"""
+    if not _is_operator_doc(cond):
+        return None
+    if set(cond) == {'$near'}:
+        lng, lat = _near_origin(cond['$near'])
+        return lng, lat, cond['$near'].get('$maxDistance', float('inf')) / 1000.0
+    if set(cond) == {'$geoWithin'} and set(cond['$geoWithin']) == {'$centerSphere'}:
+        (lng, lat), radius = cond['$geoWithin']['$centerSphere']
+        return lng, lat, radius * EARTH_RADIUS_KM
+    return None
+
+
+def _near_origin(cond):
+    geometry = cond['$geometry']
+    lng, lat = geometry['coordinates'][:2]
+    return lng, lat
+
+
+def _match_geo(values, op, arg):
+    if op == '$geoWithin':
+        if set(arg) != {'$centerSphere'}:
+            raise ValueError(f'Unsupported $geoWithin shape: {list(arg)}')
+        (lng, lat), radius = arg['$centerSphere']
+        return any(d <= radius * EARTH_RADIUS_KM for d in _distances_km(values, lng, lat))
+
+    lng, lat = _near_origin(arg)
+    max_km = arg.get('$maxDistance', float('inf')) / 1000.0
+    min_km = arg.get('$minDistance', 0) / 1000.0
+    return any(min_km <= d <= max_km for d in _distances_km(values, lng, lat))
+
+
+def _near_sort(query):
+    """(path, lng, lat) of the $near condition in a query, if any"""
+    for key, cond in (query or {}).items():
+        if _is_operator_doc(cond) and '$near' in cond:
+            lng, lat = _near_origin(cond['$near'])
+            return key, lng, lat
+    return None
+
+
+# Query matching ----------------------------------------------------------
+
+def _is_operator_doc(cond):
+    return isinstance(cond, dict) and cond and all(k.startswith('$') for k in cond)
+
+
+def _regex(cond):
+    pattern = cond['$regex']
+    if isinstance(pattern, str):
+        flags = 0
+        for option in cond.get('$options', ''):
+            flags |= {'i': re.I, 'm': re.M, 's': re.S, 'x': re.X}.get(option, 0)
+        pattern = re.compile(pattern, flags)
+    return pattern
+
+
+def _match_operators(values, cond):
+    """Match the values found at a path against an operator document"""
+    candidates = _expand(values)
+    for op, arg in cond.items():
+        if op == '$eq':
+            ok = any(_equals(v, arg) for v in candidates)
+        elif op == '$ne':
+            ok = not any(_equals(v, arg) for v in candidates)
+        elif op == '$in':
+            ok = any(_equals(v, a) for v in candidates for a in arg)
+        elif op == '$nin':
+            ok = not any(_equals(v, a) for v in candidates for a in arg)
+        elif op in ('$lt', '$lte', '$gt', '$gte'):
+            compare = {
+                '$lt': lambda a, b: a < b, '$lte': lambda a, b: a <= b,
+                '$gt': lambda a, b: a > b, '$gte': lambda a, b: a >= b,
+            }[op]
+            ok = any(_comparable(v, arg) and compare(v, arg) for v in candidates)
+        elif op == '$exists':
+            ok = any(v is not MISSING for v in values) == bool(arg)
+        elif op == '$regex':
+            pattern = _regex(cond)
+            ok = any(isinstance(v, str) and pattern.search(v) for v in candidates)
+        elif op == '$options':
+            continue
+        elif op == '$elemMatch':
+            ok = any(
+                isinstance(v, list) and any(_match_element(e, arg) for e in v)
+                for v in values
+            )
+        elif op == '$type':
+            if arg != 'date':
+                raise ValueError(f'Unsupported $type: {arg!r}')
+            ok = any(isinstance(v, datetime) for v in candidates)
+        elif op in ('$geoWithin', '$near'):
+            ok = _match_geo(values, op, arg)
+        elif op == '$not':
+            ok = not _match_operators(values, arg)
+        else:
+            raise ValueError(f'Unsupported query operator: {op}')
+        if not ok:
+            return False
+    return True
+
+
+def _match_element(element, cond):
+    """Match an array element for $elemMatch / $pull"""
+    if _is_operator_doc(cond):
+        return _match_operators([element], cond)
+    if isinstance(cond, dict):
+        return isinstance(element, dict) and matches(element, cond)
+    return _equals(element, cond)
+
+
+def matches(doc, query):
+    """Whether a document satisfies a Mongo-style query"""
+    for key, cond in (query or {}).items():
+        if key == '$or':
+            if not any(matches(doc, sub) for sub in cond):
+                return False
+        elif key == '$and':
+            if not all(matches(doc, sub) for sub in cond):
+                return False
+        elif key.startswith('$'):
+            raise ValueError(f'Unsupported query operator: {key}')
+        elif _is_operator_doc(cond):
+            if not _match_operators(get_values(doc, key), cond):
+                return False
+        else:
+            if not any(_equals(v, cond) for v in _expand(get_values(doc, key))):
+                return False
+    return True
+
+
+# Updates -----------------------------------------------------------------
+
+def _parent(doc, path, create):
+    parts = path.split('.')
+    target = doc
+    for part in parts[:-1]:
+        if isinstance(target, list) and part.isdigit():
+            target = target[int(part)]
+            continue
+        if part not in target or not isinstance(target[part], (dict, list)):
+            if not create:
+                return None, parts[-1]
+            target[part] = {}
+        target = target[part]
+    return target, parts[-1]
+
+
+def _set(doc, path, value):
+    parent, key = _parent(doc, path, create=True)
+    if isinstance(parent, list):
+        parent[int(key)] = value
+    else:
+        parent[key] = value
+
+
+def _get(doc, path, default=None):
+    parent, key = _parent(doc, path, create=False)
+    if isinstance(parent, dict):
+        return parent.get(key, default)
+    if isinstance(parent, list) and key.isdigit() and int(key) < len(parent):
+        return parent[int(key)]
+    return default
+
+
+def _sort_key(value):
+    return (_type_rank(value), value if _type_rank(value) in (1, 2, 5, 6, 7) else 0)
+
+
+def _sort_list(items, spec):
+    if isinstance(spec, dict):
+        for field, direction in reversed(list(spec.items())):
+            items.sort(key=lambda e: _sort_key(_get(e, field) if isinstance(e, dict) else None),
+                       reverse=direction < 0)
+    else:
+        items.sort(key=_sort_key, reverse=spec < 0)
+
+
+def apply_update(doc, update, inserting=False):
+    """Apply update operators to a document in place"""
+    for op, fields in update.items():
+        if op == '$setOnInsert':
+            if inserting:
+                for path, value in fields.items():
+                    _set(doc, path, copy.deepcopy(value))
+        elif op == '$set':
+            for path, value in fields.items():
+                _set(doc, path, copy.deepcopy(value))
+        elif op == '$unset':
+            for path in fields:
+                parent, key = _parent(doc, path, create=False)
+                if isinstance(parent, dict):
+                    parent.pop(key, None)
+        elif op == '$inc':
+            for path, amount in fields.items():
+                _set(doc, path, (_get(doc, path) or 0) + amount)
+        elif op == '$push':
+            for path, value in fields.items():
+                current = _get(doc, path)
+                items = list(current) if isinstance(current, list) else []
+                if isinstance(value, dict) and '$each' in value:
+                    items.extend(copy.deepcopy(value['$each']))
+                    if '$sort' in value:
+                        _sort_list(items, value['$sort'])
+                    if '$slice' in value:
+                        limit = value['$slice']
+                        items = items[:limit] if limit >= 0 else items[limit:]
+                else:
+                    items.append(copy.deepcopy(value))
+                _set(doc, path, items)
+        elif op == '$pull':
+            for path, cond in fields.items():
+                current = _get(doc, path)
+                if isinstance(current, list):
+                    _set(doc, path, [e for e in current if not _match_element(e, cond)])
+        else:
+            raise ValueError(f'Unsupported update operator: {op}')
+
+
+def _upsert_seed(query):
+    """Fields an upsert copies from the equality parts of its filter"""
+    seed = {}
+    for key, cond in (query or {}).items():
+        if key.startswith('$') or _is_operator_doc(cond):
+            continue
+        _set(seed, key, copy.deepcopy(cond))
+    return seed
+
+
+def project(doc, projection):
+    """Copy a document, keeping only included top-level fields"""
+    if not projection:
+        return copy.deepcopy(doc)
+    fields = {path.split('.')[0] for path, keep in projection.items() if keep}
+    if projection.get('_id', 1):
+        fields.add('_id')
+    return {k: copy.deepcopy(v) for k, v in doc.items() if k in fields}
+
+
+# Indexes -----------------------------------------------------------------
+
+def _index_keys(doc, path):
+    keys = set()
+    for value in _expand(get_values(doc, path)):
+        if value is MISSING:
+            value = None
+        try:
+            hash(value)
+        except TypeError:
+            continue  # subdocuments and arrays are not indexed themselves
+        keys.add(value)
+    return keys
+
+
+class HashIndex:
+    """Multikey hash index on one field: value -> set of document ids"""
+
+    def __init__(self, field, unique=False, expire_after=None):
+        self.field = field
+        self.unique = unique
+        self.expire_after = expire_after
+        self.buckets = {}
+
+    def add(self, doc_id, doc):
+        keys = _index_keys(doc, self.field)
+        if self.unique:
+            for key in keys:
+                if key is not None and self.buckets.get(key, set()) - {doc_id}:
+                    raise DuplicateKeyError(f'Duplicate key for {self.field}: {key!r}')
+        for key in keys:
+            self.buckets.setdefault(key, set()).add(doc_id)
+
+    def remove(self, doc_id, doc):
+        for key in _index_keys(doc, self.field):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(doc_id)
+                if not bucket:
+                    del self.buckets[key]
+
+    def lookup(self, cond):
+        """Candidate ids for a filter condition, or None if unusable"""
+        if _is_operator_doc(cond):
+            if set(cond) == {'$in'}:
+                values = cond['$in']
+            elif set(cond) == {'$eq'}:
+                values = [cond['$eq']]
+            else:
+                return None
+        elif isinstance(cond, (dict, list)):
+            return None
+        else:
+            values = [cond]
+
+        ids = set()
+        for value in values:
+            try:
+                ids |= self.buckets.get(value, set())
+            except TypeError:
+                return None
+        return ids
+
+
+class GeoIndex:
+    """Grid index on GeoJSON points: (lat cell, lng cell) -> set of document ids"""
+
+    KM_PER_DEGREE = 111.32
+    MAX_CELLS = 20000  # beyond this a scan is cheaper
+
+    def __init__(self, field, cell_degrees=0.01):
+        self.field = field
+        self.cell = cell_degrees
+        self.unique = False
+        self.expire_after = None
+        self.buckets = {}
+
+    def _cells(self, doc):
+        cells = set()
+        for value in get_values(doc, self.field):
+            coords = coordinates(value)
+            if coords is not None:
+                cells.add((math.floor(coords[0] / self.cell), math.floor(coords[1] / self.cell)))
+        return cells
+
+    def add(self, doc_id, doc):
+        for key in self._cells(doc):
+            self.buckets.setdefault(key, set()).add(doc_id)
+
+    def remove(self, doc_id, doc):
+        for key in self._cells(doc):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(doc_id)
+                if not bucket:
+                    del self.buckets[key]
+
+    def lookup(self, cond):
+        """Ids in cells overlapping the query circle, or None if unusable"""
+        circle = _geo_circle(cond)
+        if circle is None:
+            return None
+        lng, lat, radius_km = circle
+        dlat = radius_km / self.KM_PER_DEGREE
+        cos_lat = math.cos(math.radians(min(89.9, abs(lat) + dlat)))
+        dlng = radius_km / (self.KM_PER_DEGREE * cos_lat)
+        if lat - dlat < -90 or lat + dlat > 90 or lng - dlng < -180 or lng + dlng > 180:
+            return None  # poles and the antimeridian: fall back to a scan
+
+        rows = range(math.floor((lat - dlat) / self.cell), math.floor((lat + dlat) / self.cell) + 1)
+        cols = range(math.floor((lng - dlng) / self.cell), math.floor((lng + dlng) / self.cell) + 1)
+        if len(rows) * len(cols) > min(self.MAX_CELLS, 4 * len(self.buckets) + 1):
+            return None
+        ids = set()
+        for row in rows:
+            for col in cols:
+                ids |= self.buckets.get((row, col), set())
+        return ids
+
+
+# Repository --------------------------------------------------------------
+
+class MemoryRepository(Repository):
+    """Repository keeping one collection in process memory"""
+
+    def __init__(self, name, persistence=None):
+        self.name = name
+        self.persistence = persistence
+        self.docs = {}
+        self.order = {}  # _id -> insertion sequence, keeps natural order
+        self.indexes = {}
+        self._sequence = 0
+        self._lock = threading.RLock()
+        self._last_ttl_check = 0.0
+
+        if persistence is not None:
+            for doc in persistence.load(name):
+                self._add(doc)
+
+    # internal helpers
+
+    def _add(self, doc):
+        doc_id = doc['_id']
+        added = []
+        try:
+            for index in self.indexes.values():
+                index.add(doc_id, doc)
+                added.append(index)
+        except DuplicateKeyError:
+            for index in added:
+                index.remove(doc_id, doc)
+            raise
+        self.docs[doc_id] = doc
+        if doc_id not in self.order:
+            self._sequence += 1
+            self.order[doc_id] = self._sequence
+
+    def _remove(self, doc_id, keep_order=False):
+        doc = self.docs.pop(doc_id)
+        for index in self.indexes.values():
+            index.remove(doc_id, doc)
+        if not keep_order:
+            self.order.pop(doc_id, None)
+        return doc
+
+    def _candidates(self, query):
+        """Ids worth checking for a query, narrowed by an index if possible"""
+        query = query or {}
+        if '_id' in query:
+            cond = query['_id']
+            if _is_operator_doc(cond) and set(cond) == {'$in'}:
+                return [i for i in cond['$in'] if i in self.docs]
+            if not _is_operator_doc(cond):
+                return [cond] if cond in self.docs else []
+
+        # Top-level conditions are ANDed, so index hits can be intersected
+        best = None
+        for index in self.indexes.values():
+            if index.field in query:
+                ids = index.lookup(query[index.field])
+                if ids is not None:
+                    best = ids if best is None else best & ids
+        if best is None:
+            return list(self.docs)
+        return sorted(best, key=lambda doc_id: self.order.get(doc_id, 0))
+
+    def _matching(self, query):
+        for doc_id in self._candidates(query):
+            doc = self.docs.get(doc_id)
+            if doc is not None and matches(doc, query):
+                yield doc
+
+    def _persist(self, saved=(), deleted=()):
+        if self.persistence is not None and (saved or deleted):
+            self.persistence.write(self.name, list(saved), list(deleted))
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        if now - self._last_ttl_check < TTL_CHECK_INTERVAL:
+            return
+        self._last_ttl_check = now
+        for index in self.indexes.values():
+            if index.expire_after is None:
+                continue
+            cutoff = datetime.utcnow() - timedelta(seconds=index.expire_after)
+            expired = [doc_id for doc_id, doc in self.docs.items()
+                       if isinstance(doc.get(index.field), datetime) and doc[index.field] <= cutoff]
+            for doc_id in expired:
+                self._remove(doc_id)
+            self._persist(deleted=expired)
+
+    def _replace(self, old, new):
+        doc_id = old['_id']
+        self._remove(doc_id, keep_order=True)
+        try:
+            self._add(new)
+        except DuplicateKeyError:
+            self._add(old)
+            raise
+        return new
+
+    def _update_docs(self, docs, update):
+        saved = []
+        for doc in docs:
+            new = copy.deepcopy(doc)
+            apply_update(new, update)
+            new['_id'] = doc['_id']
+            if new != doc:
+                saved.append(self._replace(doc, new))
+        return saved
+
+    def _upsert(self, query, update=None, replacement=None):
+        if replacement is not None:
+            doc = copy.deepcopy(replacement)
+            if '_id' not in doc and '_id' in query and not _is_operator_doc(query['_id']):
+                doc['_id'] = query['_id']
+        else:
+            doc = _upsert_seed(query)
+            apply_update(doc, update, inserting=True)
+        doc.setdefault('_id', ObjectId())
+        self._add(doc)
+        return doc
+
+    # public API
+
+    def insert_one(self, doc):
+        with self._lock:
+            self._purge_expired()
+            doc.setdefault('_id', ObjectId())
+            if doc['_id'] in self.docs:
+                raise DuplicateKeyError(f"Duplicate _id: {doc['_id']!r}")
+            stored = copy.deepcopy(doc)
+            self._add(stored)
+            self._persist(saved=[stored])
+            return doc['_id']
+
+    def insert_many(self, docs):
+        with self._lock:
+            return [self.insert_one(doc) for doc in docs]
+
+    def find_one(self, filter=None, projection=None):
+        with self._lock:
+            for doc in self._matching(filter):
+                return project(doc, projection)
+            return None
+
+    def find(self, filter=None, projection=None, sort=None, skip=0, limit=0):
+        with self._lock:
+            docs = list(self._matching(filter))
+            near = _near_sort(filter)
+            if near and not sort:
+                path, lng, lat = near
+                docs.sort(key=lambda d: min(_distances_km(get_values(d, path), lng, lat)))
+            if sort:
+                for field, direction in reversed(list(sort)):
+                    docs.sort(key=lambda d: _sort_key(next(iter(get_values(d, field)))),
+                              reverse=direction < 0)
+            if skip:
+                docs = docs[skip:]
+            if limit:
+                docs = docs[:limit]
+            return [project(doc, projection) for doc in docs]
+
+    def count_documents(self, filter=None, limit=0):
+        with self._lock:
+            count = 0
+            for _ in self._matching(filter):
+                count += 1
+                if limit and count >= limit:
+                    break
+            return count
+
+    def update_one(self, filter, update, upsert=False):
+        with self._lock:
+            self._purge_expired()
+            doc = next(self._matching(filter), None)
+            if doc is None:
+                if not upsert:
+                    return UpdateResult(0, 0, None)
+                new = self._upsert(filter, update=update)
+                self._persist(saved=[new])
+                return UpdateResult(0, 0, new['_id'])
+            saved = self._update_docs([doc], update)
+            self._persist(saved=saved)
+            return UpdateResult(1, len(saved), None)
+
+    def update_many(self, filter, update):
+        with self._lock:
+            docs = list(self._matching(filter))
+            saved = self._update_docs(docs, update)
+            self._persist(saved=saved)
+            return UpdateResult(len(docs), len(saved), None)
+
+    def replace_one(self, filter, replacement, upsert=False):
+        with self._lock:
+            self._purge_expired()
+            doc = next(self._matching(filter), None)
+            if doc is None:
+                if not upsert:
+                    return UpdateResult(0, 0, None)
+                new = self._upsert(filter, replacement=replacement)
+                self._persist(saved=[new])
+                return UpdateResult(0, 0, new['_id'])
+            new = copy.deepcopy(replacement)
+            new['_id'] = doc['_id']
+            self._replace(doc, new)
+            self._persist(saved=[new])
+            return UpdateResult(1, 1, None)
+
+    def delete_one(self, filter):
+        with self._lock:
+            doc = next(self._matching(filter), None)
+            if doc is None:
+                return 0
+            self._remove(doc['_id'])
+            self._persist(deleted=[doc['_id']])
+            return 1
+
+    def delete_many(self, filter):
+        with self._lock:
+            ids = [doc['_id'] for doc in self._matching(filter)]
+            for doc_id in ids:
+                self._remove(doc_id)
+            self._persist(deleted=ids)
+            return len(ids)
+
+    def bulk_write(self, operations):
+        with self._lock:
+            for op in operations:
+                if isinstance(op, ReplaceOne):
+                    self.replace_one(op.filter, op.replacement, upsert=op.upsert)
+                elif isinstance(op, UpdateOne):
+                    self.update_one(op.filter, op.update, upsert=op.upsert)
+                else:
+                    raise TypeError(f'Unsupported bulk operation: {op!r}')
+
+    def create_index(self, keys, unique=False, expireAfterSeconds=None, **options):
+        field = keys if isinstance(keys, str) else keys[0][0]
+        name = keys if isinstance(keys, str) else '_'.join(f'{f}_{d}' for f, d in keys)
+        with self._lock:
+            if name in self.indexes:
+                return name
+            if not isinstance(keys, str) and keys[0][1] == '2dsphere':
+                index = GeoIndex(field)
+            else:
+                index = HashIndex(field, unique=unique, expire_after=expireAfterSeconds)
+            for doc_id, doc in self.docs.items():
+                index.add(doc_id, doc)
+            self.indexes[name] = index
+            return name
+
+
+class MemoryBackend:
+    """Backend holding every collection in memory, optionally persisted"""
+
+    is_available = True
+
+    def __init__(self, persistence=None):
+        self.persistence = persistence
+        self._repositories = {}
+        self._lock = threading.Lock()
+
+    def repository(self, name):
+        repo = self._repositories.get(name)
+        if repo is None:
+            with self._lock:
+                repo = self._repositories.get(name)
+                if repo is None:
+                    repo = self._repositories[name] = MemoryRepository(name, self.persistence)
+        return repo
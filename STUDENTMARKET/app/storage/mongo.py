@@ -0,0 +1,81 @@
+"""MongoDB backend: repositories are thin wrappers around PyMongo collections."""
+import pymongo
+
+from app.storage import Repository, ReplaceOne, UpdateOne, UpdateResult
+
+
+def _result(res):
+    return UpdateResult(res.matched_count, res.modified_count, res.upserted_id)
+
+
+class MongoRepository(Repository):
+    """Repository backed by a PyMongo collection"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def insert_one(self, doc):
+        return self.collection.insert_one(doc).inserted_id
+
+    def insert_many(self, docs):
+        return self.collection.insert_many(docs, ordered=False).inserted_ids
+
+    def find_one(self, filter=None, projection=None):
+        return self.collection.find_one(filter or {}, projection)
+
+    def find(self, filter=None, projection=None, sort=None, skip=0, limit=0):
+        return self.collection.find(filter or {}, projection, sort=sort, skip=skip, limit=limit)
+
+    def count_documents(self, filter=None, limit=0):
+        options = {'limit': limit} if limit else {}
+        return self.collection.count_documents(filter or {}, **options)
+
+    def update_one(self, filter, update, upsert=False):
+        return _result(self.collection.update_one(filter, update, upsert=upsert))
+
+    def update_many(self, filter, update):
+        return _result(self.collection.update_many(filter, update))
+
+    def replace_one(self, filter, replacement, upsert=False):
+        return _result(self.collection.replace_one(filter, replacement, upsert=upsert))
+
+    def delete_one(self, filter):
+        return self.collection.delete_one(filter).deleted_count
+
+    def delete_many(self, filter):
+        return self.collection.delete_many(filter).deleted_count
+
+    def bulk_write(self, operations):
+        requests = []
+        for op in operations:
+            if isinstance(op, ReplaceOne):
+                requests.append(pymongo.ReplaceOne(op.filter, op.replacement, upsert=op.upsert))
+            elif isinstance(op, UpdateOne):
+                requests.append(pymongo.UpdateOne(op.filter, op.update, upsert=op.upsert))
+            else:
+                raise TypeError(f'Unsupported bulk operation: {op!r}')
+        if requests:
+            self.collection.bulk_write(requests, ordered=False)
+
+    def create_index(self, keys, **options):
+        return self.collection.create_index(keys, **options)
+
+    def aggregate(self, pipeline, **options):
+        return self.collection.aggregate(pipeline, **options)
+
+    def watch(self, pipeline=None, **options):
+        return self.collection.watch(pipeline, **options)
+
+
+class MongoBackend:
+    """Backend handing out repositories for a Flask-PyMongo database"""
+
+    def __init__(self, mongo):
+        self.mongo = mongo
+
+    @property
+    def is_available(self):
+        return getattr(self.mongo, 'db', None) is not None
+
+    def repository(self, name):
+        return MongoRepository(self.mongo.db[name])
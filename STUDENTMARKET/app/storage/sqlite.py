@@ -0,0 +1,61 @@
+"""SQLite persistence for the embedded backend.
+
+Every collection is loaded into memory at startup; each write through a
+``MemoryRepository`` is then written through to a single ``documents``
+table as BSON, one transaction per repository call.
+"""
+import os
+import sqlite3
+import threading
+
+import bson
+
+
+def _key(doc_id):
+    return f'{type(doc_id).__name__}:{doc_id}'
+
+
+class SQLitePersistence:
+    """Write-through document store in one SQLite file"""
+
+    def __init__(self, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS documents ('
+            ' collection TEXT NOT NULL,'
+            ' id TEXT NOT NULL,'
+            ' doc BLOB NOT NULL,'
+            ' PRIMARY KEY (collection, id))'
+        )
+        self._conn.commit()
+
+    def load(self, collection):
+        """Yield every stored document of a collection"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT doc FROM documents WHERE collection = ? ORDER BY rowid',
+                (collection,)
+            ).fetchall()
+        for (blob,) in rows:
+            yield bson.decode(blob)
+
+    def write(self, collection, saved, deleted):
+        """Upsert saved documents and remove deleted ids in one transaction"""
+        with self._lock, self._conn:
+            if saved:
+                self._conn.executemany(
+                    'INSERT INTO documents (collection, id, doc) VALUES (?, ?, ?) '
+                    'ON CONFLICT (collection, id) DO UPDATE SET doc = excluded.doc',
+                    [(collection, _key(doc['_id']), bson.encode(doc)) for doc in saved]
+                )
+            if deleted:
+                self._conn.executemany(
+                    'DELETE FROM documents WHERE collection = ? AND id = ?',
+                    [(collection, _key(doc_id)) for doc_id in deleted]
+                )
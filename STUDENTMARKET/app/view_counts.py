@@ -0,0 +1,117 @@
+"""Buffered ad view counters.
+
+A ``$inc`` per page view would double the write load of ``ads.view_ad``,
+the busiest endpoint. Instead each worker process counts views in memory
+and a background thread flushes them as one unordered ``bulk_write`` of
+``$inc`` updates, either every ``VIEW_FLUSH_INTERVAL`` seconds or as soon as
+``VIEW_FLUSH_THRESHOLD`` views are pending. Buffered views are flushed once
+more when the worker exits normally.
+
+Acceptable loss: a worker that crashes (SIGKILL, OOM, segfault) loses the
+views it has not flushed yet, i.e. at most ``VIEW_FLUSH_INTERVAL`` seconds
+or ``VIEW_FLUSH_THRESHOLD`` views of traffic per worker. View counts are
+only used for display and the "most viewed" sort, so that is fine. If a
+flush fails the counts go back into the buffer and are retried.
+
+Views of an ad that is archived or deleted before the flush are dropped;
+the updates never upsert.
+"""
+import atexit
+import os
+import threading
+
+from bson.objectid import ObjectId
+
+from app.storage import UpdateOne
+
+
+def ensure_indexes():
+    """Create indexes for the "most viewed" sort"""
+    from app import db
+    db.ads.create_index([('category', 1), ('views', -1), ('created_at', -1)])
+    db.ads.create_index([('views', -1), ('created_at', -1)])
+
+
+class ViewCounter:
+    """Per-process buffer of ad views, flushed in batches"""
+
+    def __init__(self, app=None):
+        self.interval = 5.0
+        self.threshold = 200
+        self.enabled = True
+        self._pending = {}
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.interval = app.config.get('VIEW_FLUSH_INTERVAL', 5.0)
+        self.threshold = app.config.get('VIEW_FLUSH_THRESHOLD', 200)
+        self.enabled = app.config.get('VIEW_COUNTS_ENABLED', True)
+        if self.enabled:
+            atexit.register(self.flush)
+
+    def record(self, ad_id):
+        """Count one view of an ad"""
+        if not self.enabled:
+            return
+        self._ensure_flusher()
+        with self._lock:
+            self._pending[ad_id] = self._pending.get(ad_id, 0) + 1
+            self._pending_total += 1
+            full = self._pending_total >= self.threshold
+        if full:
+            self._wakeup.set()
+
+    def pending(self, ad_id):
+        """Views of an ad buffered in this process and not yet flushed"""
+        return self._pending.get(ad_id, 0)
+
+    def flush(self):
+        """Write buffered views with one unordered bulk_write"""
+        from app import db
+
+        with self._lock:
+            counts, self._pending = self._pending, {}
+            self._pending_total = 0
+        if not counts or not db.is_available:
+            return 0
+
+        operations = [
+            UpdateOne({'_id': ObjectId(ad_id)}, {'$inc': {'views': n}})
+            for ad_id, n in counts.items()
+        ]
+        try:
+            db.ads.bulk_write(operations)
+        except Exception as e:
+            print(f"Warning: Could not flush {len(counts)} ad view counters: {e}")
+            with self._lock:
+                for ad_id, n in counts.items():
+                    self._pending[ad_id] = self._pending.get(ad_id, 0) + n
+                    self._pending_total += n
+            return 0
+        return len(counts)
+
+    def _ensure_flusher(self):
+        # Threads do not survive fork, so start one per worker process
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Views buffered before a fork belong to the parent process
+            self._pending = {}
+            self._pending_total = 0
+            self._thread = threading.Thread(target=self._run, name='view-counter', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
@@ -0,0 +1,158 @@
+"""Benchmark nearby-ads queries (``Ad.get_all(near=...)``) on geotagged ads.
+
+Loads synthetic ads clustered around campuses in a 30 km city, then times
+the full nearby listing (count + one page, nearest first) for several
+radii, with and without a category filter, on the first and a later page.
+
+Runs against MongoDB by default, in a separate database that is dropped
+afterwards (``--keep`` to reuse it); ``--backend memory`` measures the
+embedded engine instead.
+
+Usage (from the STUDENTMARKET directory):
+    python benchmarks/bench_nearby.py --ads 100000
+    python benchmarks/bench_nearby.py --backend memory --ads 100000 --queries 20
+"""
+import argparse
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask  # noqa: E402
+
+from app import db, geo, mongo  # noqa: E402
+from app.models import Ad  # noqa: E402
+
+CATEGORIES = ['books', 'electronics', 'scripts', 'clothes', 'furniture', 'sports', 'other']
+CITY_CENTER = (48.137, 11.575)
+CITY_RADIUS_KM = 15
+KM_PER_DEGREE = 111.32
+
+
+def offset(lat, lng, north_km, east_km):
+    """Move a point by a number of kilometres"""
+    return (lat + north_km / KM_PER_DEGREE,
+            lng + east_km / (KM_PER_DEGREE * math.cos(math.radians(lat))))
+
+
+def make_campuses(rng, count):
+    return [offset(*CITY_CENTER, rng.uniform(-10, 10), rng.uniform(-10, 10)) for _ in range(count)]
+
+
+def make_ads(count, campuses, seed=42):
+    """Ads around campuses (80%, ~1 km spread) and scattered over the city"""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    for i in range(count):
+        if rng.random() < 0.8:
+            lat, lng = offset(*rng.choice(campuses), rng.gauss(0, 1.0), rng.gauss(0, 1.0))
+        else:
+            lat, lng = offset(*CITY_CENTER, rng.uniform(-CITY_RADIUS_KM, CITY_RADIUS_KM),
+                              rng.uniform(-CITY_RADIUS_KM, CITY_RADIUS_KM))
+        created_at = now - timedelta(minutes=i)
+        yield {
+            'title': f'Bench ad {i}',
+            'description': 'Synthetic ad for the nearby benchmark',
+            'description_html': '',
+            'category': rng.choice(CATEGORIES),
+            'created_by': 'bench',
+            'created_at': created_at,
+            'expires_at': created_at + timedelta(days=120),
+            'views': 0,
+            'location': geo.point(lat, lng),
+            'location_name': None,
+            'campus': None,
+        }
+
+
+def load(count, campuses, batch_size=5000):
+    batch = []
+    for doc in make_ads(count, campuses):
+        batch.append(doc)
+        if len(batch) == batch_size:
+            db.ads.insert_many(batch)
+            batch = []
+    if batch:
+        db.ads.insert_many(batch)
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+def run(campuses, radius_km, category, page, queries, per_page, rng):
+    timings, results = [], []
+    for _ in range(queries):
+        center = offset(*rng.choice(campuses), rng.gauss(0, 0.5), rng.gauss(0, 0.5))
+        start = time.perf_counter()
+        ads, total = Ad.get_all(category=category, page=page, per_page=per_page,
+                                near=center, radius_km=radius_km)
+        timings.append((time.perf_counter() - start) * 1000.0)
+        results.append(total)
+    return timings, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend', choices=['mongo', 'memory'], default='mongo')
+    parser.add_argument('--mongo-uri', default=os.environ.get('BENCH_MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--db', default='studentmarket_bench')
+    parser.add_argument('--ads', type=int, default=100000)
+    parser.add_argument('--campuses', type=int, default=12)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--per-page', type=int, default=12)
+    parser.add_argument('--keep', action='store_true', help='keep the Mongo benchmark database')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['STORAGE_BACKEND'] = args.backend
+    if args.backend == 'mongo':
+        mongo.init_app(app, uri=f"{args.mongo_uri.rstrip('/')}/{args.db}")
+    db.init_app(app, mongo)
+
+    rng = random.Random(7)
+    campuses = make_campuses(rng, args.campuses)
+
+    with app.app_context():
+        geo.ensure_indexes()
+        existing = db.ads.count_documents({})
+        if existing and existing != args.ads:
+            sys.exit(f'{args.db}.ads already holds {existing} ads; drop it or pass --ads {existing}')
+        if not existing:
+            start = time.perf_counter()
+            load(args.ads, campuses)
+            print(f'loaded {args.ads} ads in {time.perf_counter() - start:.1f}s')
+
+        if args.backend == 'mongo':
+            query = {'location': geo.near(*campuses[0], 2), 'category': 'books'}
+            plan = mongo.db.ads.find(query).limit(args.per_page).explain()['queryPlanner']['winningPlan']
+            plan = plan.get('queryPlan', plan)  # MongoDB 5+ with the slot-based engine
+            stages = []
+            while plan:
+                stages.append(plan.get('stage') + (f"({plan['indexName']})" if 'indexName' in plan else ''))
+                plan = plan.get('inputStage')
+            print('plan:', ' <- '.join(stages))
+
+        print(f"{'radius':>7} {'category':>9} {'page':>4} {'matches':>8} "
+              f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for radius_km in (1, 2, 5, 10):
+            for category in (None, 'books'):
+                for page in (1, 5):
+                    timings, totals = run(campuses, radius_km, category, page,
+                                          args.queries, args.per_page, rng)
+                    print(f'{radius_km:>5}km {category or "all":>9} {page:>4} '
+                          f'{statistics.mean(totals):>8.0f} {percentile(timings, 50):>8.1f} '
+                          f'{percentile(timings, 95):>8.1f} {percentile(timings, 99):>8.1f}')
+
+    if args.backend == 'mongo' and not args.keep:
+        mongo.cx.drop_database(args.db)
+
+
+if __name__ == '__main__':
+    main()
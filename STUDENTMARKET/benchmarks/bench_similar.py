@@ -0,0 +1,68 @@
+"""Benchmark a full similar-ads rebuild on synthetic ads.
+
+Measures the in-process part of ``similar.rebuild_all`` (tokenizing,
+TF-IDF vectorization and top-k neighbour search); Mongo reads and writes
+are not included.
+
+Usage (from the STUDENTMARKET directory):
+    python benchmarks/bench_similar.py --ads 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.similar import compute_neighbours  # noqa: E402
+
+CATEGORIES = ['books', 'electronics', 'scripts', 'clothes', 'furniture', 'sports', 'other']
+LETTERS = 'abcdefghijklmnopqrstuvwxyz'
+
+
+def make_vocabulary(rng, size):
+    """Random pseudo-words (tokenizer ignores digits, so no 'term123')"""
+    return [''.join(rng.choices(LETTERS, k=rng.randint(4, 9))) for _ in range(size)]
+
+
+def make_ads(count, seed=42):
+    """Generate synthetic ads with Zipf-distributed, category-flavoured words"""
+    rng = random.Random(seed)
+    shared = make_vocabulary(rng, 5000)
+    per_category = {c: make_vocabulary(rng, 3000) for c in CATEGORIES}
+    shared_weights = [1.0 / (rank + 1) for rank in range(len(shared))]
+    category_weights = [1.0 / (rank + 1) for rank in range(3000)]
+
+    ads = []
+    for i in range(count):
+        words = per_category[rng.choice(CATEGORIES)]
+        title = rng.choices(words, weights=category_weights, k=4)
+        body = (rng.choices(words, weights=category_weights, k=15)
+                + rng.choices(shared, weights=shared_weights, k=25))
+        ads.append({'_id': f'ad{i}', 'title': ' '.join(title), 'description': ' '.join(body)})
+    return ads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ads', type=int, default=100000)
+    parser.add_argument('--top-k', type=int, default=6)
+    parser.add_argument('--chunk-size', type=int, default=256)
+    args = parser.parse_args()
+
+    ads = make_ads(args.ads)
+    start = time.perf_counter()
+    _, idf, _, neighbours = compute_neighbours(ads, args.top_k, args.chunk_size)
+    elapsed = time.perf_counter() - start
+
+    print(f'ads:         {args.ads}')
+    print(f'vocabulary:  {len(idf)}')
+    print(f'top_k:       {args.top_k}')
+    print(f'chunk_size:  {args.chunk_size}')
+    print(f'rebuild:     {elapsed:.2f}s ({elapsed / args.ads * 1e6:.1f} us/ad)')
+    assert len(neighbours) == args.ads
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -36,7 +37,11 @@ class Config:
         MONGO_URI = f'mongodb://localhost:27017/{_mongo_db_env}'
     
     MONGO_DBNAME = _mongo_db_env
-    
+
+    # Storage backend: mongo, memory or sqlite (see app/storage)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'mongo')
+    SQLITE_PATH = os.environ.get('SQLITE_PATH', 'instance/studentmarket.sqlite3')
+
     # Email Configuration
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
     MAIL_PORT = int(os.environ.get('MAIL_PORT', 465))
@@ -52,9 +57,63 @@ class Config:
     SESSION_COOKIE_SAMESITE = 'Lax'
     REMEMBER_COOKIE_DURATION = 7  # days
     
+    # Admission control overrides: class -> [max concurrent, max waiting, max wait seconds]
+    # (defaults live in app/admission.py DEFAULT_LIMITS)
+    ADMISSION_CONTROL_ENABLED = os.environ.get('ADMISSION_CONTROL_ENABLED', 'True') == 'True'
+    ADMISSION_LIMITS = json.loads(os.environ.get('ADMISSION_LIMITS', '{}'))
+    ADMISSION_TARGET_LATENCY_MS = float(os.environ.get('ADMISSION_TARGET_LATENCY_MS', 50))
+    
+    # Admin request profiler (X-Profile: 1 or ?_profile=1 on a request)
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'True') == 'True'
+    PROFILER_INTERVAL_MS = float(os.environ.get('PROFILER_INTERVAL_MS', 5))
+    PROFILER_TRACEMALLOC_FRAMES = int(os.environ.get('PROFILER_TRACEMALLOC_FRAMES', 10))
+    PROFILER_TOP_ALLOCATIONS = 30
+    PROFILE_RETENTION_DAYS = int(os.environ.get('PROFILE_RETENTION_DAYS', 7))
+    
     # Pagination
     ITEMS_PER_PAGE = 12
     
+    # Similar ads
+    SIMILAR_ADS_TOP_K = int(os.environ.get('SIMILAR_ADS_TOP_K', 6))
+    SIMILAR_ADS_CANDIDATES = int(os.environ.get('SIMILAR_ADS_CANDIDATES', 2000))
+    
+    # Ad expiry and archival
+    AD_LIFETIME_DAYS = int(os.environ.get('AD_LIFETIME_DAYS', 120))
+    AD_CATEGORY_LIFETIME_DAYS = {
+        'scripts': 365,  # lecture notes stay useful for a whole year
+    }
+    AD_ARCHIVE_BATCH_SIZE = int(os.environ.get('AD_ARCHIVE_BATCH_SIZE', 500))
+    
+    # Ad locations: campuses offered in the ad form and the nearby filter,
+    # as JSON: [{"id": "main", "name": "Main Campus", "lat": 48.15, "lng": 11.58}]
+    CAMPUS_LOCATIONS = json.loads(os.environ.get('CAMPUS_LOCATIONS', '[]'))
+    NEARBY_RADII_KM = [1, 2, 5, 10, 25]
+    NEARBY_DEFAULT_RADIUS_KM = float(os.environ.get('NEARBY_DEFAULT_RADIUS_KM', 5))
+    NEARBY_MAX_RADIUS_KM = float(os.environ.get('NEARBY_MAX_RADIUS_KM', 50))
+    
+    # Ad view counters: buffered per worker, flushed every N seconds or N views
+    VIEW_COUNTS_ENABLED = os.environ.get('VIEW_COUNTS_ENABLED', 'True') == 'True'
+    VIEW_FLUSH_INTERVAL = float(os.environ.get('VIEW_FLUSH_INTERVAL', 5))
+    VIEW_FLUSH_THRESHOLD = int(os.environ.get('VIEW_FLUSH_THRESHOLD', 200))
+    
+    # Live new-ads feed (Server-Sent Events)
+    LIVE_FEED_ENABLED = os.environ.get('LIVE_FEED_ENABLED', 'True') == 'True'
+    # Threads per worker (gunicorn.conf.py reads the same variable); streams
+    # may use all but LIVE_FEED_RESERVED_THREADS of them
+    WORKER_THREADS = int(os.environ.get('WORKER_THREADS', 32))
+    LIVE_FEED_RESERVED_THREADS = int(os.environ.get('LIVE_FEED_RESERVED_THREADS', 16))
+    LIVE_FEED_MAX_CLIENTS = int(os.environ['LIVE_FEED_MAX_CLIENTS']) if os.environ.get('LIVE_FEED_MAX_CLIENTS') else None
+    LIVE_FEED_QUEUE_SIZE = int(os.environ.get('LIVE_FEED_QUEUE_SIZE', 100))
+    LIVE_FEED_POLL_INTERVAL = float(os.environ.get('LIVE_FEED_POLL_INTERVAL', 2))
+    LIVE_FEED_HEARTBEAT = float(os.environ.get('LIVE_FEED_HEARTBEAT', 15))
+    LIVE_FEED_REPLAY_LIMIT = int(os.environ.get('LIVE_FEED_REPLAY_LIMIT', 50))
+    
+    # Saved searches and digest emails
+    SAVED_SEARCH_LIMIT = int(os.environ.get('SAVED_SEARCH_LIMIT', 20))
+    DIGEST_BATCH_SIZE = int(os.environ.get('DIGEST_BATCH_SIZE', 50))
+    DIGEST_MAX_ADS = int(os.environ.get('DIGEST_MAX_ADS', 20))
+    SITE_URL = os.environ.get('SITE_URL', 'http://localhost:5000')
+    
     # Admin User
     ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME', 'admin')
     ADMIN_EMAIL = os.environ.get('ADMIN_EMAIL', 'admin@studentmarket.local')
@@ -73,8 +132,23 @@ class ProductionConfig(Config):
     SESSION_COOKIE_SECURE = True
 
 
+class TestingConfig(Config):
+    """Testing configuration (embedded storage, no background work)"""
+    TESTING = True
+    STORAGE_BACKEND = 'memory'
+    WTF_CSRF_ENABLED = False
+    RATELIMIT_ENABLED = False
+    MAIL_SUPPRESS_SEND = True
+    ADMIN_PASSWORD = None
+    ADMISSION_CONTROL_ENABLED = False
+    VIEW_COUNTS_ENABLED = False
+    LIVE_FEED_ENABLED = False
+    PROFILER_ENABLED = False
+
+
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
+    'testing': TestingConfig,
     'default': DevelopmentConfig
 }
@@ -0,0 +1,14 @@
+"""Gunicorn settings (loaded automatically when gunicorn starts in this directory).
+
+The live feed sizes its stream budget from ``WORKER_THREADS``, so the
+thread count is read from the same variable here.
+"""
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+worker_class = 'gthread'
+threads = int(os.environ.get('WORKER_THREADS', 32))
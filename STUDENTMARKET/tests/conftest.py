@@ -0,0 +1,27 @@
+import pytest
+
+from app import create_app, db
+from app.storage.memory import MemoryBackend
+from app.storage.sqlite import SQLitePersistence
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    """A fresh embedded backend, persisted to a temporary file for sqlite"""
+    if request.param == 'memory':
+        return MemoryBackend()
+    return MemoryBackend(SQLitePersistence(str(tmp_path / 'test.sqlite3')))
+
+
+@pytest.fixture
+def repo(backend):
+    return backend.repository('things')
+
+
+@pytest.fixture
+def app():
+    """Application on the in-memory backend, with a request context pushed"""
+    app = create_app('testing')
+    with app.test_request_context():
+        yield app
+    db.backend = None
@@ -0,0 +1,47 @@
+"""Admission control latency tracking."""
+from types import SimpleNamespace
+
+from flask import Flask
+
+from app.admission import DEFAULT_LIMITS, AdmissionControl, MongoLatency
+
+
+def command(name, ms):
+    return SimpleNamespace(command_name=name, duration_micros=int(ms * 1000))
+
+
+def test_latency_ignores_awaiting_get_more():
+    latency = MongoLatency()
+    for _ in range(50):
+        latency.succeeded(command('getMore', 1000))  # idle change stream
+        latency.succeeded(command('find', 2))
+    assert latency.average_ms < 5
+
+
+def test_latency_tracks_slow_commands():
+    latency = MongoLatency()
+    for _ in range(50):
+        latency.succeeded(command('find', 200))
+    assert latency.average_ms > 100
+
+
+def test_slow_class_only_shrinks_its_own_limit():
+    admission = AdmissionControl()
+    admission.init_app(Flask(__name__))
+    admission.adjust_interval = 0
+
+    admission.latency.enter('search')
+    for _ in range(50):
+        admission.latency.succeeded(command('find', 500))
+    admission.latency.leave()
+    admission.latency.succeeded(command('find', 500))  # outside any request
+    admission.latency.enter('login')
+    admission.latency.succeeded(command('find', 500))
+    admission.latency.leave()
+
+    for _ in range(5):
+        admission._maybe_adapt()
+    limits = {name: limiter.limit for name, limiter in admission.limiters.items()}
+    expected = {name: limit for name, (limit, _, _) in DEFAULT_LIMITS.items()}
+    expected['search'] = 1
+    assert limits == expected
@@ -0,0 +1,59 @@
+"""Live feed admission: who may open a stream, and how many."""
+import pytest
+
+from app import new_ads_feed
+from app.models import User
+
+
+@pytest.fixture
+def client(app):
+    user = User('Ada', 'ada@example.com', None)
+    user.set_password('secret123')
+    user.save()
+    new_ads_feed.enabled = True
+    client = app.test_client()
+    client.post('/auth/login', data={'email': 'ada@example.com', 'password': 'secret123'})
+    yield client
+    new_ads_feed.enabled = False
+
+
+def open_feed(client, multithread=True):
+    return client.get('/ads/live', environ_overrides={'wsgi.multithread': multithread})
+
+
+def test_anonymous_visitors_get_no_feed(app):
+    new_ads_feed.enabled = True
+    try:
+        response = open_feed(app.test_client())
+        assert response.status_code == 302
+        page = app.test_client().get('/')
+        assert b'live-feed' not in page.data
+    finally:
+        new_ads_feed.enabled = False
+
+
+def test_sync_workers_refuse_streams(client):
+    response = open_feed(client, multithread=False)
+    assert response.status_code == 503
+    assert response.headers['Retry-After']
+
+
+def test_streams_are_capped_by_spare_threads(app, client, monkeypatch):
+    assert new_ads_feed.max_clients == (app.config['WORKER_THREADS']
+                                        - app.config['LIVE_FEED_RESERVED_THREADS'])
+    monkeypatch.setattr(new_ads_feed, 'max_clients', 1)
+
+    first = open_feed(client)
+    assert first.status_code == 200
+    assert first.mimetype == 'text/event-stream'
+    assert open_feed(client).status_code == 503
+
+    first.close()
+    second = open_feed(client)
+    assert second.status_code == 200
+    second.close()
+
+
+def test_no_spare_threads_means_no_streams(client, monkeypatch):
+    monkeypatch.setattr(new_ads_feed, 'max_clients', 0)
+    assert open_feed(client).status_code == 503
@@ -0,0 +1,169 @@
+"""Model behaviour on the in-memory backend."""
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+
+from app import db, stats
+from app.models import Ad, SavedSearch, User
+
+
+def make_user(email='ada@example.com'):
+    user = User('Ada', email, None)
+    user.set_password('secret123')
+    user.save()
+    return user
+
+
+def make_ad(user, title='Calculus textbook', description='Barely used, no notes inside',
+            category='books', **kwargs):
+    ad = Ad(title, description, category, user.id, **kwargs)
+    ad.save()
+    return ad
+
+
+def test_user_roundtrip(app):
+    user = make_user()
+    loaded = User.get_by_email('ada@example.com')
+    assert loaded.id == user.id
+    assert loaded.check_password('secret123')
+    assert not loaded.check_password('wrong')
+    assert User.get_by_id(user.id).name == 'Ada'
+
+
+def test_user_delete_removes_ads_and_searches(app):
+    user = make_user()
+    make_ad(user)
+    SavedSearch(user.id, search='lamp').save()
+    user.delete()
+    assert User.get_by_id(user.id) is None
+    assert db.ads.count_documents({}) == 0
+    assert db.saved_searches.count_documents({}) == 0
+
+
+def test_ad_save_sets_html_expiry_and_views(app):
+    ad = make_ad(make_user(), description='**Bold** claim here')
+    loaded = Ad.get_by_id(ad.id)
+    assert '<strong>Bold</strong>' in loaded.description_html
+    assert loaded.expires_at == ad.created_at + Ad.lifetime_for('books')
+    assert loaded.views == 0
+
+
+def test_ad_update_keeps_views(app):
+    ad = make_ad(make_user())
+    db.ads.update_one({'_id': ObjectId(ad.id)}, {'$inc': {'views': 3}})
+    ad.title = 'Calculus textbook, 3rd edition'
+    ad.save()
+    loaded = Ad.get_by_id(ad.id)
+    assert (loaded.title, loaded.views) == ('Calculus textbook, 3rd edition', 3)
+
+
+def test_get_all_filters_and_paginates(app):
+    user = make_user()
+    now = datetime.utcnow()
+    for i in range(5):
+        make_ad(user, title=f'Book number {i}', created_at=now - timedelta(minutes=i))
+    make_ad(user, title='Desk lamp', category='furniture', created_at=now - timedelta(minutes=10))
+
+    ads, total = Ad.get_all(category='books', page=2, per_page=2)
+    assert total == 5
+    assert [ad.title for ad in ads] == ['Book number 2', 'Book number 3']
+
+    ads, total = Ad.get_all(search='lamp')
+    assert (total, ads[0].title) == (1, 'Desk lamp')
+
+
+def test_search_matches_word_prefixes(app):
+    user = make_user()
+    make_ad(user, title='Calculus TI-84 calculator', description='Graphing calculator in a case')
+    assert Ad.get_all(search='calc')[1] == 1
+    assert Ad.get_all(search='CALCULATOR ti')[1] == 1
+    assert Ad.get_all(search='alc')[1] == 0
+    assert Ad.get_all(search='linear algebra')[1] == 0
+
+
+def test_saved_search_matches_like_the_list(app):
+    seller, buyer = make_user(), make_user('bob@example.com')
+    for query in ('calc', 'graphing case', 'alc', 'linear algebra'):
+        SavedSearch(buyer.id, search=query).save()
+    SavedSearch(buyer.id, category='furniture').save()
+
+    make_ad(seller, title='Calculus TI-84 calculator', description='Graphing calculator in a case')
+
+    matched = {db.saved_searches.find_one({'_id': ObjectId(m['saved_search_id'])})['search']
+               for m in db.search_matches.find({})}
+    assert matched == {'calc', 'graphing case'}
+
+
+def test_sort_by_views(app):
+    user = make_user()
+    quiet = make_ad(user, title='Quiet ad')
+    popular = make_ad(user, title='Popular ad')
+    db.ads.update_one({'title': 'Popular ad'}, {'$inc': {'views': 10}})
+    ads, _ = Ad.get_all(sort='views')
+    assert [ad.id for ad in ads] == [popular.id, quiet.id]
+
+
+def test_ad_create_and_delete_update_stats(app):
+    user = make_user()
+    ad = make_ad(user)
+    totals = stats.get_totals()
+    assert (totals['users'], totals['ads_created'], totals['ads_live']) == (1, 1, 1)
+
+    ad.delete()
+    totals = stats.get_totals()
+    assert (totals['ads_deleted'], totals['ads_live']) == (1, 0)
+    assert Ad.get_by_id(ad.id) is None
+
+
+def test_stats_failure_does_not_fail_the_write(app, monkeypatch, capsys):
+    def broken(*args, **kwargs):
+        raise RuntimeError('rollups unavailable')
+    monkeypatch.setattr(stats, '_bump', broken)
+
+    user = make_user()
+    ad = make_ad(user)
+    assert Ad.get_by_id(ad.id) is not None
+    assert 'Could not update statistics' in capsys.readouterr().out
+
+
+def test_similar_failure_does_not_fail_the_delete(app, monkeypatch, capsys):
+    from app import similar
+
+    def broken(*args, **kwargs):
+        raise RuntimeError('ad_similar unavailable')
+    monkeypatch.setattr(similar, 'remove_ads', broken)
+
+    ad = make_ad(make_user())
+    assert ad.delete()
+    assert Ad.get_by_id(ad.id) is None
+    assert stats.get_totals()['ads_deleted'] == 1
+    assert 'Could not remove similar ads' in capsys.readouterr().out
+
+
+def test_search_uses_stored_words(app):
+    from app import notifications
+
+    make_ad(make_user(), title='Übungsblatt Analysis', description='Lösungen inklusive')
+    assert db.ads.find_one({})['words'] == ['analysis', 'inklusive', 'lösungen', 'übungsblatt']
+    assert Ad.get_all(search='ÜBUNG')[1] == 1
+    assert Ad.get_all(search='bung')[1] == 0
+
+    db.ads.insert_one({'title': 'Old lamp', 'description': 'Saved before search words',
+                       'category': 'furniture', 'created_by': 'x', 'created_at': datetime.utcnow()})
+    assert Ad.get_all(search='lamp')[1] == 0
+    assert notifications.backfill_ad_words() == 1
+    assert Ad.get_all(search='lamp')[1] == 1
+
+
+def test_stats_backfill_keeps_deletion_counts(app):
+    user = make_user()
+    make_ad(user)
+    make_ad(user, title='Desk lamp', category='furniture').delete()
+    day = datetime.utcnow().strftime('%Y-%m-%d')
+    db.stats_daily.update_one({'_id': day}, {'$set': {'ads_created': 0, 'categories': {}}})
+
+    assert stats.backfill() == 1
+    daily = db.stats_daily.find_one({'_id': day})
+    assert (daily['ads_created'], daily['categories'], daily['ads_deleted']) == (1, {'books': 1}, 1)
+    totals = stats.get_totals()
+    assert (totals['ads_created'], totals['ads_live'], totals['ads_deleted']) == (2, 1, 1)
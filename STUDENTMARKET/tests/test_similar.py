@@ -0,0 +1,46 @@
+"""Similar-ads model storage and single-ad updates."""
+import random
+from datetime import datetime
+
+from app import db, similar
+from app.models import Ad
+
+WORDS = ('apple banana cherry delta echo foxtrot golf hotel india juliet kilo lima '
+         'mike november oscar papa quebec romeo sierra tango uniform victor').split()
+
+
+def rare_word(i):
+    return 'x' + chr(97 + i // 26 % 26) + chr(97 + i % 26)
+
+
+def load_ads(count=250):
+    rng = random.Random(1)
+    db.ads.insert_many([{
+        'title': ' '.join(rng.sample(WORDS, 3) + [rare_word(i)]),
+        'description': ' '.join(rng.sample(WORDS, 6)) + ' great condition',
+        'category': 'books',
+        'created_by': 'seller',
+        'created_at': datetime.utcnow(),
+    } for i in range(count)])
+
+
+def test_model_is_stored_per_term(app):
+    load_ads()
+    similar.rebuild_all()
+
+    assert 'idf' not in db.similar_model.find_one({'_id': similar.MODEL_ID})
+    assert db.similar_idf.find_one({'_id': 'great'})['common']
+    idf_map, common_terms, n_docs = similar._load_model({'xaa', 'great', 'apple', 'unseen'})
+    assert set(idf_map) == {'xaa'}
+    assert common_terms == {'great', 'apple'}
+    assert n_docs == 250
+
+
+def test_common_terms_do_not_spread_a_new_ad(app):
+    load_ads()
+    similar.rebuild_all()
+
+    ad = Ad('Calculus textbook great condition', 'Calculus textbook in great condition', 'books', 'other')
+    ad.save()
+    assert db.ad_similar.count_documents({'neighbours.ad_id': ad.id}) == 0
+    assert similar.get_neighbour_ids(ad.id) == []
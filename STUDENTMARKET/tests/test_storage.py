@@ -0,0 +1,243 @@
+"""Repository contract, run against the memory and sqlite backends."""
+from datetime import datetime, timedelta
+
+import pytest
+from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from app.storage import ReplaceOne, UpdateOne
+from app.storage.memory import MemoryBackend
+from app.storage.sqlite import SQLitePersistence
+
+
+@pytest.fixture
+def books(repo):
+    repo.insert_many([
+        {'_id': 1, 'title': 'Calculus', 'category': 'books', 'price': 20, 'tags': ['math', 'used']},
+        {'_id': 2, 'title': 'Linear Algebra', 'category': 'books', 'price': 35, 'tags': ['math']},
+        {'_id': 3, 'title': 'Desk lamp', 'category': 'furniture', 'price': 12},
+        {'_id': 4, 'title': 'TI-84 calculator', 'category': 'electronics', 'price': 60,
+         'seller': {'name': 'Ada', 'rating': 5}},
+    ])
+    return repo
+
+
+def ids(docs):
+    return [doc['_id'] for doc in docs]
+
+
+def test_insert_one_assigns_object_id(repo):
+    doc_id = repo.insert_one({'title': 'Chair'})
+    assert isinstance(doc_id, ObjectId)
+    assert repo.find_one({'_id': doc_id})['title'] == 'Chair'
+
+
+def test_duplicate_id_is_rejected(repo):
+    repo.insert_one({'_id': 'a'})
+    with pytest.raises(DuplicateKeyError):
+        repo.insert_one({'_id': 'a'})
+
+
+def test_returned_documents_are_copies(books):
+    doc = books.find_one({'_id': 1})
+    doc['tags'].append('changed')
+    assert books.find_one({'_id': 1})['tags'] == ['math', 'used']
+
+
+def test_equality_and_comparison_filters(books):
+    assert ids(books.find({'category': 'books'})) == [1, 2]
+    assert ids(books.find({'price': {'$gte': 20, '$lt': 60}})) == [1, 2]
+    assert ids(books.find({'seller.name': 'Ada'})) == [4]
+    assert books.find_one({'category': 'garden'}) is None
+
+
+def test_array_membership_filter(books):
+    assert ids(books.find({'tags': 'used'})) == [1]
+
+
+def test_in_nin_ne(books):
+    assert ids(books.find({'category': {'$in': ['furniture', 'electronics']}})) == [3, 4]
+    assert ids(books.find({'category': {'$nin': ['books']}})) == [3, 4]
+    assert ids(books.find({'category': {'$ne': 'books'}})) == [3, 4]
+    assert ids(books.find({'tags': {'$ne': 'used'}})) == [2, 3, 4]
+
+
+def test_exists_and_missing_fields(books):
+    assert ids(books.find({'seller': {'$exists': True}})) == [4]
+    assert ids(books.find({'tags': {'$exists': False}})) == [3, 4]
+    assert ids(books.find({'tags.1': {'$exists': True}})) == [1]
+    assert ids(books.find({'seller': None})) == [1, 2, 3]
+
+
+def test_regex_or_and(books):
+    assert ids(books.find({'title': {'$regex': '^calc', '$options': 'i'}})) == [1]
+    assert ids(books.find({'$or': [{'category': 'furniture'}, {'price': {'$gt': 50}}]})) == [3, 4]
+    assert ids(books.find({'$and': [{'tags': 'math'}, {'price': {'$gt': 25}}]})) == [2]
+
+
+def test_elem_match(repo):
+    repo.insert_many([
+        {'_id': 1, 'neighbours': [{'ad_id': 'x', 'score': 0.9}, {'ad_id': 'y', 'score': 0.1}]},
+        {'_id': 2, 'neighbours': [{'ad_id': 'x', 'score': 0.5}]},
+        {'_id': 3, 'neighbours': []},
+    ])
+    assert ids(repo.find({'neighbours': {'$elemMatch': {'score': {'$lt': 0.2}}}})) == [1]
+    assert ids(repo.find({'neighbours': {'$elemMatch': {'ad_id': 'x', 'score': {'$gt': 0.6}}}})) == [1]
+    assert ids(repo.find({'neighbours.ad_id': 'x'})) == [1, 2]
+
+
+def test_type_date(repo):
+    repo.insert_many([{'_id': 1, 'created_at': datetime(2024, 1, 1)}, {'_id': 2, 'created_at': '2024'}])
+    assert ids(repo.find({'created_at': {'$type': 'date'}})) == [1]
+
+
+def test_sort_skip_limit(books):
+    assert ids(books.find({}, sort=[('price', -1)])) == [4, 2, 1, 3]
+    assert ids(books.find({}, sort=[('category', 1), ('price', -1)])) == [2, 1, 4, 3]
+    assert ids(books.find({}, sort=[('price', 1)], skip=1, limit=2)) == [1, 2]
+    assert books.count_documents({'category': 'books'}) == 2
+    assert books.count_documents({}, limit=3) == 3
+
+
+def test_inclusion_projection(books):
+    assert books.find_one({'_id': 4}, {'title': 1}) == {'_id': 4, 'title': 'TI-84 calculator'}
+    assert books.find_one({'_id': 4}, {'title': 1, '_id': 0}) == {'title': 'TI-84 calculator'}
+
+
+def test_update_operators(books):
+    result = books.update_one({'_id': 1}, {
+        '$set': {'seller.name': 'Bob'}, '$inc': {'price': 5}, '$unset': {'tags': ''}
+    })
+    assert (result.matched_count, result.modified_count) == (1, 1)
+    assert books.find_one({'_id': 1}) == {'_id': 1, 'title': 'Calculus', 'category': 'books',
+                                          'price': 25, 'seller': {'name': 'Bob'}}
+
+    result = books.update_many({'category': 'books'}, {'$set': {'sold': True}})
+    assert (result.matched_count, result.modified_count) == (2, 2)
+    assert books.count_documents({'sold': True}) == 2
+
+
+def test_update_without_match(books):
+    result = books.update_one({'_id': 99}, {'$set': {'title': 'x'}})
+    assert (result.matched_count, result.upserted_id) == (0, None)
+    assert books.count_documents({}) == 4
+
+
+def test_push_with_sort_and_slice(repo):
+    repo.insert_one({'_id': 'ad', 'neighbours': [{'ad_id': 'a', 'score': 0.9}, {'ad_id': 'b', 'score': 0.4}]})
+    repo.update_one({'_id': 'ad'}, {'$push': {'neighbours': {
+        '$each': [{'ad_id': 'c', 'score': 0.6}], '$sort': {'score': -1}, '$slice': 2
+    }}})
+    assert repo.find_one({'_id': 'ad'})['neighbours'] == [
+        {'ad_id': 'a', 'score': 0.9}, {'ad_id': 'c', 'score': 0.6}
+    ]
+
+
+def test_push_and_pull(repo):
+    repo.insert_one({'_id': 'ad', 'tags': ['a']})
+    repo.update_one({'_id': 'ad'}, {'$push': {'tags': 'b'}})
+    repo.update_one({'_id': 'ad'}, {'$push': {'history': {'event': 'seen'}}})
+    assert repo.find_one({'_id': 'ad'})['tags'] == ['a', 'b']
+    assert repo.find_one({'_id': 'ad'})['history'] == [{'event': 'seen'}]
+
+    repo.insert_one({'_id': 'other', 'neighbours': [{'ad_id': 'x'}, {'ad_id': 'y'}, {'ad_id': 'z'}]})
+    repo.update_many({}, {'$pull': {'neighbours': {'ad_id': {'$in': ['x', 'z']}}}})
+    assert repo.find_one({'_id': 'other'})['neighbours'] == [{'ad_id': 'y'}]
+
+
+def test_upsert_update_seeds_from_filter(repo):
+    result = repo.update_one(
+        {'_id': '2024-01-01'},
+        {'$inc': {'ads_created': 1, 'categories.books': 1}, '$setOnInsert': {'first': True}},
+        upsert=True
+    )
+    assert result.upserted_id == '2024-01-01'
+    repo.update_one(
+        {'_id': '2024-01-01'},
+        {'$inc': {'ads_created': 1}, '$setOnInsert': {'first': False}},
+        upsert=True
+    )
+    assert repo.find_one({'_id': '2024-01-01'}) == {
+        '_id': '2024-01-01', 'ads_created': 2, 'categories': {'books': 1}, 'first': True
+    }
+
+
+def test_replace_one_and_upsert(books):
+    books.replace_one({'_id': 3}, {'title': 'Office lamp'})
+    assert books.find_one({'_id': 3}) == {'_id': 3, 'title': 'Office lamp'}
+
+    result = books.replace_one({'_id': 5}, {'title': 'Bike'}, upsert=True)
+    assert result.upserted_id == 5
+    assert books.find_one({'_id': 5}) == {'_id': 5, 'title': 'Bike'}
+
+
+def test_delete(books):
+    assert books.delete_one({'category': 'books'}) == 1
+    assert books.delete_many({'price': {'$gt': 0}}) == 3
+    assert books.delete_many({}) == 0
+
+
+def test_bulk_write(repo):
+    repo.insert_one({'_id': 'a', 'views': 1})
+    repo.bulk_write([
+        UpdateOne({'_id': 'a'}, {'$inc': {'views': 2}}),
+        UpdateOne({'_id': 'b'}, {'$inc': {'views': 1}}, upsert=True),
+        ReplaceOne({'_id': 'c'}, {'_id': 'c', 'views': 7}, upsert=True),
+    ])
+    assert [(d['_id'], d['views']) for d in repo.find({}, sort=[('_id', 1)])] == [
+        ('a', 3), ('b', 1), ('c', 7)
+    ]
+
+
+def test_indexed_queries_match_unindexed(books):
+    expected = ids(books.find({'category': {'$in': ['books', 'furniture']}, 'price': {'$lt': 30}}))
+    books.create_index([('category', 1), ('price', -1)])
+    books.create_index('tags')
+    assert ids(books.find({'category': {'$in': ['books', 'furniture']}, 'price': {'$lt': 30}})) == expected
+    assert ids(books.find({'tags': 'math'})) == [1, 2]
+
+    books.update_one({'_id': 2}, {'$set': {'category': 'furniture', 'tags': ['decor']}})
+    assert ids(books.find({'category': 'furniture'})) == [2, 3]
+    assert ids(books.find({'tags': 'math'})) == [1]
+
+
+def test_unique_index(repo):
+    repo.create_index('email', unique=True)
+    repo.insert_one({'_id': 1, 'email': 'a@example.com'})
+    with pytest.raises(DuplicateKeyError):
+        repo.insert_one({'_id': 2, 'email': 'a@example.com'})
+    repo.insert_one({'_id': 3, 'email': 'b@example.com'})
+    with pytest.raises(DuplicateKeyError):
+        repo.update_one({'_id': 3}, {'$set': {'email': 'a@example.com'}})
+    assert repo.find_one({'_id': 3})['email'] == 'b@example.com'
+    assert repo.count_documents({}) == 2
+
+
+def test_ttl_index_purges_expired_documents(repo):
+    repo.create_index('created_at', expireAfterSeconds=60)
+    now = datetime.utcnow()
+    repo.insert_one({'_id': 'old', 'created_at': now - timedelta(minutes=5)})
+    repo._last_ttl_check = 0.0  # do not wait for the next periodic check
+    repo.insert_one({'_id': 'new', 'created_at': now})
+    assert ids(repo.find({})) == ['new']
+
+
+def test_watch_is_mongo_only(repo):
+    with pytest.raises(NotImplementedError):
+        repo.watch()
+    with pytest.raises(NotImplementedError):
+        repo.aggregate([])
+
+
+def test_sqlite_reloads_documents_and_deletes(tmp_path):
+    path = str(tmp_path / 'persist.sqlite3')
+    repo = MemoryBackend(SQLitePersistence(path)).repository('ads')
+    ad_id = repo.insert_one({'title': 'Bike', 'created_at': datetime(2024, 5, 1), 'tags': ['a']})
+    repo.insert_one({'_id': 'gone', 'title': 'Lamp'})
+    repo.update_one({'_id': ad_id}, {'$push': {'tags': 'b'}})
+    repo.delete_one({'_id': 'gone'})
+
+    reloaded = MemoryBackend(SQLitePersistence(path)).repository('ads')
+    assert reloaded.find({}) == [
+        {'_id': ad_id, 'title': 'Bike', 'created_at': datetime(2024, 5, 1), 'tags': ['a', 'b']}
+    ]